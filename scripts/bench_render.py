@@ -0,0 +1,68 @@
+"""Benchmark rendering a template with heavy loops over variables.
+
+Usage: python scripts/bench_render.py [--entries N] [--repeat N]
+"""
+
+import argparse
+import json
+import tempfile
+import timeit
+from pathlib import Path
+
+from dobby import templates
+
+TEMPLATE = """\
+[% for name, service in services|dictsort %]
+job "[[ service.Service_Name ]]" {
+  datacenters = [[ job.data_centers|tojson ]]
+  [% for port in service.ports.values() %]
+  port "[[ port.port_label ]]" { static = [[ port.Static_Port ]] }
+  [% endfor %]
+  env {
+  [% for key, value in service.env|dictsort %]
+    [[ key ]] = "[[ value ]]-[[ job.image_tag ]]"
+  [% endfor %]
+  }
+}
+[% endfor %]
+"""
+
+
+def generate(entries):
+    return {
+        "job": {"data_centers": ["dc1", "dc2"], "image_tag": "1.0"},
+        "services": {
+            f"service{i}": {
+                "service_name": f"service-{i}",
+                "ports": {
+                    f"p{j}": {"port_label": f"p{j}", "static_port": 8000 + j}
+                    for j in range(5)
+                },
+                "env": {f"key{j}": f"value-{j}" for j in range(10)},
+            }
+            for i in range(entries)
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template, var_file = Path(tmp) / "bench.nomad", Path(tmp) / "vars.json"
+        template.write_text(TEMPLATE)
+        var_file.write_text(json.dumps(generate(args.entries)))
+
+        def render():
+            return templates.render(template, [var_file], {})
+
+        render()
+        best = min(timeit.repeat(render, number=1, repeat=args.repeat))
+        print(f"{args.entries} services: {best * 1000:.1f} ms per render")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark the start-up of the CLI via `python -X importtime`.
+
+Exits with status 1 if importing `dobby.cli` takes longer than the budget or
+pulls in modules which are only needed by some commands.
+
+Usage: python scripts/bench_startup.py [--budget MS] [--repeat N] [--top N]
+"""
+
+import argparse
+import subprocess
+import sys
+
+# Modules which must only be imported by the commands needing them
+DEFERRED = ("httpx", "jinja2", "yaml", "dotenv", "ssl", "asyncio")
+
+
+def import_times():
+    """Import `dobby.cli` in a fresh interpreter, returns `{module: (self, cumulative)}`."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import dobby.cli"],
+        stderr=subprocess.PIPE,
+        check=True,
+        text=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header
+        times[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=100, help="In milliseconds.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.repeat)]
+    best = min(runs, key=lambda times: times["dobby.cli"][1])
+    total = best["dobby.cli"][1]
+
+    print(f"Slowest imports (best of {args.repeat} runs, self time):\n")
+    by_time = sorted(best.items(), key=lambda i: -i[1][0])[: args.top]
+    for name, (self_ms, cumulative_ms) in by_time:
+        print(f"  {self_ms:8.1f} ms  {cumulative_ms:8.1f} ms  {name}")
+    print(f"\nimport dobby.cli: {total:.1f} ms (budget {args.budget:.0f} ms)")
+
+    failed = False
+    if total > args.budget:
+        print("Start-up budget exceeded.")
+        failed = True
+    eager = [name for name in DEFERRED if name in best]
+    if eager:
+        print(f"Imported eagerly: {', '.join(eager)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark loading large variable files with the available backends.
+
+Usage: python scripts/bench_vars.py [--entries N] [--repeat N]
+"""
+
+import argparse
+import json
+import tempfile
+import timeit
+from pathlib import Path
+
+import yaml
+
+from dobby import templates
+
+
+def generate(entries):
+    return {
+        f"service_{i}": {
+            "image": f"registry.example.com/service-{i}:1.{i}",
+            "replicas": i % 5 + 1,
+            "enabled": i % 3 == 0,
+            "env": {f"KEY_{j}": f"value-{i}-{j}" for j in range(10)},
+            "ports": [8000 + i, 9000 + i],
+        }
+        for i in range(entries)
+    }
+
+
+def bench(label, f, repeat):
+    best = min(timeit.repeat(f, number=1, repeat=repeat))
+    print(f"{label:<28} {best * 1000:10.1f} ms")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = generate(args.entries)
+    with tempfile.TemporaryDirectory() as tmp:
+        yaml_file, json_file = Path(tmp) / "vars.yml", Path(tmp) / "vars.json"
+        yaml_file.write_text(yaml.safe_dump(data))
+        json_file.write_text(json.dumps(data))
+        size = yaml_file.stat().st_size / 1024 / 1024
+        print(f"{args.entries} entries, {size:.1f} MiB of YAML\n")
+
+        def load_yaml_python():
+            with open(yaml_file, "rb") as fh:
+                return yaml.load(fh, Loader=yaml.SafeLoader)
+
+        def load_yaml_libyaml():
+            with open(yaml_file, "rb") as fh:
+                return yaml.load(fh, Loader=templates.SafeLoader)
+
+        def load_json_stdlib():
+            return json.loads(json_file.read_bytes())
+
+        def load_json_fast():
+            return templates.load_json(json_file.read_bytes())
+
+        bench("yaml (SafeLoader)", load_yaml_python, args.repeat)
+        if templates.SafeLoader is not yaml.SafeLoader:
+            bench("yaml (CSafeLoader)", load_yaml_libyaml, args.repeat)
+        else:
+            print("yaml (CSafeLoader)           not available")
+        bench("json (json)", load_json_stdlib, args.repeat)
+        if templates.orjson is not None:
+            bench("json (orjson)", load_json_fast, args.repeat)
+        else:
+            print("json (orjson)                not installed")
+        bench("load_var_file (yaml)", lambda: templates.load_var_file(yaml_file), 1)
+
+
+if __name__ == "__main__":
+    main()
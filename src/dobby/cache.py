@@ -0,0 +1,188 @@
+import hashlib
+import marshal
+import os
+import time
+from pathlib import Path
+
+# Upper bound for the size of all cached parse results
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+# Upper bound for the size of compiled templates and their analysis
+TEMPLATES_MAX_SIZE = 32 * 1024 * 1024
+# Time to trust a remembered Nomad server version before asking again
+VERSION_TTL = 10 * 60
+
+
+def cache_dir():
+    if "DOBBY_CACHE_DIR" in os.environ:
+        return Path(os.environ["DOBBY_CACHE_DIR"])
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "dobby"
+
+
+def digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode() if isinstance(part, str) else part)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def make_dirs(path):
+    """Create the directory `path` (and its parents) readable by the user only.
+
+    Cached jobs and variables often contain secrets.
+    """
+    missing = []
+    while not path.is_dir():
+        missing.append(path)
+        path = path.parent
+    for path in reversed(missing):
+        path.mkdir(mode=0o700, exist_ok=True)
+
+
+def write_atomic(path, data):
+    make_dirs(path.parent)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(fd, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def evict(entries, max_size):
+    """Delete the least recently used of `entries` (paths) beyond `max_size`."""
+    stats = []
+    for entry in entries:
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        stats.append((stat.st_mtime, stat.st_size, entry))
+
+    size = sum(e[1] for e in stats)
+    for _, entry_size, entry in sorted(stats):
+        if size <= max_size:
+            break
+        try:
+            entry.unlink()
+        except OSError:
+            continue
+        size -= entry_size
+
+
+class ParseCache:
+    """Content addressed on-disk cache for `/v1/jobs/parse` responses.
+
+    Entries are keyed by the rendered HCL and the version of the Nomad server
+    which parsed it. Reading an entry bumps its modification time, so the
+    least recently used entries are evicted once `max_size` is exceeded.
+    """
+
+    def __init__(self, path=None, max_size=DEFAULT_MAX_SIZE):
+        self.path = Path(path) if path else cache_dir()
+        self.max_size = max_size
+
+    def _entry(self, version, hcl):
+        key = digest(version, hcl)
+        return self.path / "parse" / key[:2] / key
+
+    def get(self, version, hcl):
+        entry = self._entry(version, hcl)
+        try:
+            data = entry.read_bytes()
+            os.utime(entry)
+        except OSError:
+            return None
+        return data
+
+    def set(self, version, hcl, data):
+        try:
+            write_atomic(self._entry(version, hcl), data)
+            self.evict()
+        except OSError:
+            pass
+
+    def evict(self):
+        evict((self.path / "parse").glob("*/*"), self.max_size)
+
+    def get_version(self, address):
+        """Return the remembered server version for `address` if still fresh.
+
+        An empty string means the version could not be determined.
+        """
+        entry = self.path / "versions" / digest(address)
+        try:
+            if time.time() - entry.stat().st_mtime < VERSION_TTL:
+                return entry.read_text()
+        except OSError:
+            pass
+        return None
+
+    def set_version(self, address, version):
+        try:
+            write_atomic(self.path / "versions" / digest(address), version.encode())
+        except OSError:
+            pass
+
+
+class VarsCache:
+    """On-disk snapshots of merged and normalized variable files.
+
+    A snapshot is keyed by the list of variable files and only used while the
+    modification time and size of every file as well as `fingerprint` (which
+    covers everything else the result depends on) are unchanged.
+
+    Snapshots are also kept in memory (checked the same way), which saves
+    loading them again in long running processes (ie `dobby serve`). On disk
+    they are stored with `marshal`, which (unlike `pickle`) cannot run code
+    when a shared cache is tampered with. Variables `marshal` cannot store
+    (ie dates) are not snapshotted.
+    """
+
+    _loaded = {}
+    MAX_LOADED = 16
+
+    def __init__(self, fingerprint, path=None):
+        self.fingerprint = fingerprint
+        self.path = Path(path) if path else cache_dir()
+
+    def entry(self, files):
+        return self.path / "vars" / digest(*(str(f) for f in files))
+
+    def _stamp(self, files):
+        stamp = [self.fingerprint]
+        for f in files:
+            stat = os.stat(f)
+            stamp.append((str(f), stat.st_mtime_ns, stat.st_size))
+        return stamp
+
+    def get(self, files):
+        try:
+            stamp = self._stamp(files)
+            entry = self.entry(files)
+            snapshot = self._loaded.get(entry)
+            if snapshot is None or snapshot["stamp"] != stamp:
+                with open(entry, "rb") as fh:
+                    snapshot = marshal.load(fh)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get("stamp") != stamp:
+            return None
+        self._remember(entry, snapshot)
+        return snapshot["vars"]
+
+    def _remember(self, entry, snapshot):
+        self._loaded.pop(entry, None)
+        self._loaded[entry] = snapshot
+        while len(self._loaded) > self.MAX_LOADED:
+            del self._loaded[next(iter(self._loaded))]
+
+    def set(self, files, data):
+        try:
+            snapshot = {"stamp": self._stamp(files), "vars": data}
+            entry = self.entry(files)
+            self._remember(entry, snapshot)
+            write_atomic(entry, marshal.dumps(snapshot))
+        except (OSError, ValueError):
+            return None
+        return entry
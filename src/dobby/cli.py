@@ -1,28 +1,45 @@
+import json
 import os
 import sys
-import time
+from pathlib import Path
 
 import click
 
-from . import formatter, templates, utils
-
-try:
-    from importlib.metadata import version
-except ModuleNotFoundError:
-    from importlib_metadata import version
+from . import daemon, formatter, planfile, utils
+from .hcl import ParseError
 
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 
 
+def print_version(ctx, param, value):
+    if not value or ctx.resilient_parsing:
+        return
+    try:
+        from importlib.metadata import version
+    except ModuleNotFoundError:
+        from importlib_metadata import version
+
+    click.echo(f"{ctx.find_root().info_name}, version {version('dobby')}")
+    ctx.exit()
+
+
 @click.group(cls=utils.Group, context_settings=CONTEXT_SETTINGS)
-@click.version_option(version("dobby"), "--version", "-v")
+@click.option(
+    "--version",
+    "-v",
+    is_flag=True,
+    expose_value=False,
+    is_eager=True,
+    callback=print_version,
+    help="Show the version and exit.",
+)
 def cli():
     """Dobby deploys (Jinja-)templated jobs to nomad"""
 
 
 @cli.command()
 @utils.connectivity_options
-@utils.template_options
+@utils.template_options(multiple=True)
 @click.option(
     "--verbose",
     "-v",
@@ -37,44 +54,404 @@ def cli():
     default=False,
     help="Do not wait for the deployment to finish and quit after submission.",
 )
-@utils.pass_config
+@click.option(
+    "--parallelism",
+    "-j",
+    type=click.IntRange(1),
+    default=4,
+    show_default=True,
+    help="Number of jobs (per target) to plan and submit concurrently.",
+)
+@click.option(
+    "--skip-unchanged",
+    is_flag=True,
+    default=False,
+    help="Do not submit jobs which are identical to the running version.",
+)
+@click.option(
+    "--plan",
+    "plan_files",
+    type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+    multiple=True,
+    help=(
+        "Submit a job saved by `dobby plan --out` instead of rendering it. "
+        "Can be specified multiple times."
+    ),
+)
+@click.option(
+    "--targets-file",
+    "targets",
+    type=click.Path(exists=True, dir_okay=False),
+    callback=utils.read_targets_file,
+    help=(
+        "YAML/JSON list of `{region: ..., namespace: ...}` to deploy to, "
+        "instead of the combinations of `--region` and `--namespace` (which "
+        "must not be set)."
+    ),
+)
+@click.option(
+    "--canary",
+    is_flag=True,
+    default=False,
+    help=(
+        "Deploy to the first target on its own and only continue with the "
+        "other targets if that succeeded."
+    ),
+)
+@utils.monitor_options
+@utils.output_options
+@utils.diff_options
+@utils.profile_options
+@utils.pass_config(multi_target=True)
 @click.pass_context
-def deploy(ctx, config, input, verbose, detach, var_files, strict=True):
-    """Deploy a job to Nomad after templating it."""
-    job_spec = templates.render(input, var_files)
-    job = config.parse_hcl_or_exit(job_spec)
+async def deploy(
+    ctx,
+    config,
+    inputs,
+    verbose,
+    detach,
+    parallelism,
+    skip_unchanged,
+    plan_files,
+    targets,
+    canary,
+    monitor_mode,
+    output,
+    diff_options,
+    profiler,
+    var_files,
+    strict=True,
+):
+    """Deploy jobs to Nomad after templating them.
+
+    INPUTS can be job files, directories (all `*.nomad` files within) or glob
+    patterns. Multiple jobs are deployed concurrently.
+
+    With `--skip-unchanged` jobs for which the plan reports no changes are
+    neither submitted nor monitored, their status is "unchanged".
+
+    Jobs saved via `--plan` are submitted as planned, if they changed since
+    they were planned the submission is refused and their status is "stale".
+
+    Given multiple regions and/or namespaces (or `--targets-file`) every job
+    is rendered once and deployed to all targets concurrently.
+    """
+    import asyncio
+
+    paths = utils.expand_inputs(inputs) if inputs or not plan_files else []
+    plan_files = [Path(p) for p in plan_files]
+    targets = deploy_targets(ctx, config, targets)
+    multi_target = len(targets) > 1
+    multi_job = len(paths) + len(plan_files) > 1
+    batch = multi_job or multi_target
+    # Jobs are limited per target, so one target cannot take all the slots
+    semaphores = {target: asyncio.Semaphore(parallelism) for target in targets}
+    machine = output != "text"
+    renders = {}
+
+    async def render(path):
+        if path not in renders:
+            renders[path] = asyncio.ensure_future(
+                render_job(config, path, var_files, profiler)
+            )
+        job_spec = await renders[path]
+        # Nomad was connected to while rendering
+        await warm_up
+        return job_spec
+
+    async def deploy_one(target_config, path, saved=False):
+        prefix = [target_config.target.label] if multi_target else []
+        prefix += [path.stem] if multi_job else []
+        echo = utils.JobOutput(" ".join(prefix) or None, err=machine)
+        async with semaphores[target_config.target]:
+            try:
+                if saved:
+                    result = await apply_plan(
+                        target_config, path, detach, echo, strict, skip_unchanged
+                    )
+                else:
+                    result = await deploy_job(
+                        target_config,
+                        path,
+                        var_files,
+                        verbose,
+                        detach,
+                        echo,
+                        strict,
+                        output,
+                        diff_options,
+                        skip_unchanged,
+                        job_spec=await render(path),
+                    )
+            except utils.handled_errors() as e:
+                if not batch:
+                    raise
+                echo(utils.describe_error(e), fg="red")
+                result = JobResult(path, echo)
+                result.status = "error"
+        if multi_target:
+            result.target = target_config.target.label
+        if result.eval_id and monitor_mode == "blocking":
+            await result.monitor(target_config)
+        if output == "ndjson" and not (result.eval_id and monitor_mode == "events"):
+            click.echo(json.dumps(result.as_dict()))
+        return result
+
+    async def deploy_to(targets):
+        target_configs = [config.for_target(target) for target in targets]
+        per_target = await asyncio.gather(
+            *(
+                asyncio.gather(
+                    *(deploy_one(target_config, path) for path in paths),
+                    *(deploy_one(target_config, p, saved=True) for p in plan_files),
+                )
+                for target_config in target_configs
+            )
+        )
+        if monitor_mode == "events":
+            await asyncio.gather(
+                *(
+                    follow_events(target_config, results, output)
+                    for target_config, results in zip(target_configs, per_target)
+                )
+            )
+        return [result for results in per_target for result in results]
+
+    # Saved plans are submitted right away, there is nothing to overlap with
+    warming_up = config.for_target(targets[0]).warming_up(enabled=bool(paths))
+    async with warming_up as warm_up:
+        if canary and multi_target:
+            results = await deploy_to(targets[:1])
+            if all(result.successful for result in results):
+                results += await deploy_to(targets[1:])
+            else:
+                click.secho(
+                    f"\nCanary deployment to {targets[0].label!r} failed, "
+                    "skipping the remaining targets.",
+                    fg="red",
+                    bold=True,
+                    err=machine,
+                )
+        else:
+            results = await deploy_to(targets)
 
-    data = plan_job(ctx, config, job, verbose)
+    if output == "json":
+        click.echo(json.dumps([result.as_dict() for result in results], indent=2))
 
-    if data["FailedTGAllocs"] and strict:
-        click.secho("\nAborting execution due to failed allocations.", fg="red")
+    if batch:
+        echo_summary(results, err=machine)
+
+    if not all(result.successful for result in results):
         ctx.exit(1)
 
-    response = config.client.put(
-        "/v1/jobs",
-        json={
-            "Job": job,
-            "JobModifyIndex": data["JobModifyIndex"],
-            "EnforceIndex": True,
-        },
-    )
-    if response.status_code != 200:
-        raise utils.ApiError(response)
 
+async def render_job(config, input, var_files, profiler=None):
+    from . import runner, templates
+
+    with config.timings.span("render"):
+        return await runner.run_sync(
+            templates.render, input, var_files, os.environ, profiler
+        )
+
+
+async def follow_events(config, results, output="text"):
+    """Follow the submitted `results` (of a single target) via the event stream."""
+    from . import monitor
+
+    events = monitor.EventMonitor(config)
+    watches = {}
+    for result in results:
+        if result.eval_id:
+            watch = events.watch(result.job_id, result.eval_id, echo=result.echo)
+            watches[watch] = result
+    await events.run()
+    for watch, result in watches.items():
+        result.finish(watch.success)
+        if output == "ndjson":
+            click.echo(json.dumps(result.as_dict()))
+
+
+def echo_summary(results, err=False):
+    click.secho("\nSummary:", bold=True, err=err)
+    for result in results:
+        color = "green" if result.successful else "red"
+        job = repr(result.job_id) if result.job_id else "-"
+        where = result.input.name
+        if result.target:
+            where += f" in {result.target}"
+        click.echo(
+            f"- {job} ({where}): " + click.style(result.status, fg=color), err=err
+        )
+
+
+class JobResult:
+    def __init__(self, input, echo):
+        self.input = input
+        self.echo = echo
+        self.job_id = None
+        self.eval_id = None
+        self.status = None
+        self.plan = None
+        self.target = None
+
+    @property
+    def successful(self):
+        return self.status in ("deployed", "submitted", "unchanged")
+
+    def as_dict(self):
+        return {
+            "job": self.job_id,
+            "file": self.input.name,
+            "target": self.target,
+            "status": self.status,
+            "eval_id": self.eval_id,
+            "plan": self.plan,
+        }
+
+    async def monitor(self, config):
+        success = await monitor_job(config, self.job_id, self.eval_id, echo=self.echo)
+        self.finish(success)
+
+    def finish(self, success):
+        if success:
+            self.status = "deployed"
+            self.echo("\nJob deployment finished succesfully.", fg="green", bold=True)
+        else:
+            self.status = "failed"
+            self.echo("\nJob deployment failed.", fg="red", bold=True)
+
+
+async def deploy_job(
+    config,
+    input,
+    var_files,
+    verbose,
+    detach,
+    echo,
+    strict=True,
+    output="text",
+    diff_options=formatter.NO_LIMITS,
+    skip_unchanged=False,
+    job_spec=None,
+):
+    """Render, plan and submit a single job, returns a `JobResult`.
+
+    Rendering is skipped if `job_spec` is given.
+    """
+    result = JobResult(input, echo)
+    if job_spec is None:
+        job_spec = await render_job(config, input, var_files)
+    try:
+        job = await utils.hcl_to_json(config, job_spec)
+    except ParseError as e:
+        echo(str(e), fg="red")
+        result.status = "invalid"
+        return result
+    except utils.ApiError as e:
+        if e.response.status_code != 400:
+            raise
+        echo(e.response.text, fg="red")
+        result.status = "invalid"
+        return result
+    result.job_id = job["ID"]
+
+    with echo.block():
+        data = await plan_job(None, config, job, verbose, echo, output, diff_options)
+        if output != "text":
+            result.plan = formatter.plan_summary(data, job)
+
+        unchanged = skip_unchanged and is_unchanged(data)
+        if not check_plan(result, unchanged, strict and data["FailedTGAllocs"]):
+            return result
+
+    return await submit_job(config, result, job, data["JobModifyIndex"], detach)
+
+
+def deploy_targets(ctx, config, targets_file):
+    """The targets of the targets file or else those of `config`."""
+    if not targets_file:
+        return config.targets
+    if any(target.region or target.namespace for target in config.targets):
+        ctx.fail(
+            "--targets-file cannot be combined with --region or --namespace "
+            "(nor NOMAD_REGION or NOMAD_NAMESPACE)."
+        )
+    return targets_file
+
+
+async def apply_plan(
+    config, plan_file, detach, echo, strict=True, skip_unchanged=False
+):
+    """Submit a job saved by `dobby plan --out`, returns a `JobResult`."""
+    result = JobResult(plan_file, echo)
+    try:
+        saved = planfile.load(plan_file)
+    except planfile.PlanFileError as e:
+        echo(str(e), fg="red")
+        result.status = "invalid"
+        return result
+    job = saved["Job"]
+    result.job_id = job["ID"]
+
+    planned_for = planfile.target_mismatch(saved, config)
+    if planned_for:
+        echo(
+            f"Refusing to submit the job, it was planned against {planned_for}.",
+            fg="red",
+        )
+        result.status = "stale"
+        return result
+
+    unchanged = skip_unchanged and saved["DiffType"] == "None"
+    if not check_plan(result, unchanged, strict and saved["FailedTGAllocs"]):
+        return result
+
+    return await submit_job(config, result, job, saved["JobModifyIndex"], detach)
+
+
+def check_plan(result, unchanged, failed_allocs):
+    """Whether a planned job should be submitted, sets the status if not."""
+    if unchanged:
+        result.echo("\nJob is unchanged, skipping submission.", fg="green", bold=True)
+        result.status = "unchanged"
+        return False
+    if failed_allocs:
+        result.echo("\nAborting execution due to failed allocations.", fg="red")
+        result.status = "aborted"
+        return False
+    return True
+
+
+async def submit_job(config, result, job, job_modify_index, detach):
+    """Register `job` unless it changed since `job_modify_index`."""
+    echo = result.echo
+    with config.timings.span("submit"):
+        response = await utils.send_job(
+            config,
+            "PUT",
+            "/v1/jobs",
+            job,
+            JobModifyIndex=job_modify_index,
+            EnforceIndex=True,
+        )
+    if response.status_code != 200:
+        if "Enforcing job modify index" not in response.text:
+            raise utils.ApiError(response)
+        echo(
+            "\nRefusing to submit the job, it changed since it was planned.",
+            fg="red",
+        )
+        result.status = "stale"
+        return result
+
+    result.status = "submitted"
     if detach:
-        click.secho("\nJob submitted to Nomad successfully.", fg="green", bold=True)
-        ctx.exit()
+        echo("\nJob submitted to Nomad successfully.", fg="green", bold=True)
+        return result
 
-    data = response.json()
-    click.secho("\nJob Submission:", bold=True)
-    success, deployment_id = monitor_evaluation(config, data["EvalID"])
-    if success and deployment_id:
-        success = monitor_deployment(config, deployment_id)
-    if success:
-        click.secho("\nJob deployment finished succesfully.", fg="green", bold=True)
-    else:
-        click.secho("\nJob deployment failed.", fg="red", bold=True)
-        ctx.exit(1)
+    result.eval_id = response.json()["EvalID"]
+    echo("\nJob Submission:", bold=True)
+    return result
 
 
 @cli.command()
@@ -87,14 +464,31 @@ def deploy(ctx, config, input, verbose, detach, var_files, strict=True):
     default=False,
     help="Provide a verbose output of the planned changes.",
 )
+@click.option(
+    "--out",
+    type=click.Path(dir_okay=False, writable=True, resolve_path=True),
+    help="Save the plan to a file which can be submitted via `dobby deploy --plan`.",
+)
+@utils.output_options
+@utils.diff_options
+@utils.profile_options
 @utils.pass_config
 @click.pass_context
-def plan(ctx, config, input, var_files, verbose):
+async def plan(
+    ctx, config, input, var_files, verbose, out, output, diff_options, profiler
+):
     """Dry-run a job update to determine its effects."""
-    job_spec = templates.render(input, var_files)
-    job = config.parse_hcl_or_exit(job_spec)
+    async with config.warming_up() as warm_up:
+        job_spec = await render_job(config, input, var_files, profiler)
+        await warm_up
+    job = await config.parse_hcl_or_exit(job_spec)
 
-    plan_job(ctx, config, job, verbose)
+    data = await plan_job(ctx, config, job, verbose, click.secho, output, diff_options)
+    if out:
+        planfile.dump(out, job, data, config)
+    if output != "text":
+        summary = formatter.plan_summary(data, job)
+        click.echo(json.dumps(summary, indent=2 if output == "json" else None))
 
 
 @cli.command()
@@ -107,18 +501,21 @@ def plan(ctx, config, input, var_files, verbose):
     default=False,
     help="Purge is used to stop the job and purge it from the system.",
 )
+@utils.monitor_options
 @utils.pass_config
-def stop(config, input, var_files, purge):
+async def stop(config, input, var_files, purge, monitor_mode):
     """Stop a running job."""
-    job_spec = templates.render(input, var_files)
-    job = config.parse_hcl_or_exit(job_spec)
+    async with config.warming_up() as warm_up:
+        job_spec = await render_job(config, input, var_files)
+        await warm_up
+    job = await config.parse_hcl_or_exit(job_spec)
     params = {"purge": "true" if purge else "false"}
-    response = config.client.delete(f"/v1/job/{job['ID']}", params=params)
+    response = await config.client.delete(f"/v1/job/{job['ID']}", params=params)
     if response.status_code != 200:
         raise utils.ApiError(response)
     data = response.json()
     click.secho("Job Deletion:", bold=True)
-    success, _ = monitor_evaluation(config, data["EvalID"])
+    success = await monitor_job(config, job["ID"], data["EvalID"], monitor_mode, False)
 
     if success:
         click.secho("\nJob deletion finished succesfully.", fg="green", bold=True)
@@ -131,12 +528,14 @@ def stop(config, input, var_files, purge):
 @utils.connectivity_options
 @utils.template_options
 @utils.pass_config
-def validate(config, input, var_files):
+async def validate(config, input, var_files):
     """Checks if a given job specification is valid."""
-    job_spec = templates.render(input, var_files)
-    job = config.parse_hcl_or_exit(job_spec)
+    async with config.warming_up() as warm_up:
+        job_spec = await render_job(config, input, var_files)
+        await warm_up
+    job = await config.parse_hcl_or_exit(job_spec)
 
-    response = config.client.post("/v1/validate/job", json={"Job": job})
+    response = await utils.send_job(config, "POST", "/v1/validate/job", job)
     if response.status_code == 200:
         response = response.json()
         errors = response["Error"]
@@ -155,79 +554,168 @@ def validate(config, input, var_files):
 
 @cli.command()
 @utils.template_options
-def render(input, var_files):
+@click.option(
+    "--json",
+    "as_json",
+    is_flag=True,
+    default=False,
+    help="Output the job as JSON (parsed locally, HCL1 only).",
+)
+@utils.profile_options
+@utils.timings_options
+def render(input, var_files, as_json, profiler, timings):
     """Render a template to stdout."""
-    print(templates.render(input, var_files))
-
-
-def plan_job(ctx, config, job, verbose):
-    result = {"Job": job, "Diff": True}
-    response = config.client.put(f"/v1/job/{job['ID']}/plan", json=result)
+    from . import jobspec, templates
+
+    with timings.span("render"):
+        job_spec = templates.render(input, var_files, profiler=profiler)
+    if not as_json:
+        print(job_spec)
+        return
+    try:
+        with timings.span("parse"):
+            job = jobspec.parse(job_spec)
+    except ParseError as e:
+        click.secho(str(e), fg="red", err=True)
+        sys.exit(1)
+    print(json.dumps(job, indent=2))
+
+
+@cli.group(cls=utils.Group, name="vars")
+def vars_():
+    """Manage snapshots of variable files."""
+
+
+@vars_.command(name="compile")
+@click.argument(
+    "var_files",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+)
+@utils.timings_options
+def compile_vars(var_files, timings):
+    """Snapshot the merged variables of VAR_FILES ahead of time.
+
+    The snapshot is used by all commands given the same variable files (in the
+    same order) via `--var-file` until one of them changes.
+    """
+    from . import templates
+
+    with timings.span("compile vars"):
+        path = templates.compile_vars(var_files)
+    if path is None:
+        click.secho("Could not write the variable snapshot.", fg="red", err=True)
+        sys.exit(1)
+    click.echo(f"Compiled {len(var_files)} variable file(s) to {path}.")
+
+
+async def plan_job(
+    ctx,
+    config,
+    job,
+    verbose,
+    echo=click.secho,
+    output="text",
+    diff_options=formatter.NO_LIMITS,
+):
+    path = f"/v1/job/{job['ID']}/plan"
+    with config.timings.span("plan"):
+        response = await utils.send_job(config, "PUT", path, job, Diff=True)
 
     if response.status_code != 200:
         raise utils.ApiError(response)
 
     data = response.json()
+    if output != "text":
+        return data
     diff = data["Diff"]
     if diff:
-        click.secho("Planned changes:\n", bold=True)
-        click.echo(formatter.format_job_diff(diff, verbose), nl=False)
+        echo("Planned changes:\n", bold=True)
+        echo_stream(echo, formatter.iter_job_diff(diff, verbose, diff_options))
 
-    click.secho("Scheduler dry-run:", bold=True)
-    click.echo(formatter.format_dry_run(data, job), nl=False)
+    echo("Scheduler dry-run:", bold=True)
+    echo(formatter.format_dry_run(data, job), nl=False)
 
     return data
 
 
-def monitor_evaluation(config, eval_id):
-    click.echo(f"- Monitoring evaluation {repr(eval_id)}.")
-    deployment_id = None
-    while True:
-        response = config.client.get(f"/v1/evaluation/{eval_id}")
-        if response.status_code != 200:
-            raise utils.ApiError(response)
-        eval = response.json()
-        status = eval["Status"]
-
-        if status in ("failed", "cancelled"):
-            click.echo("\n" f"Evaluation failed: {eval['StatusDescription']}")
-            return False, deployment_id
-        elif status == "complete":
-            click.echo(f"- Evaluation {repr(eval_id)} completed successfully.")
-            if eval.get("NextEval", None):
-                eval_id = eval["NextEval"]
-                click.echo(f"- Monitoring evaluation {repr(eval_id)}.")
-            else:
-                deployment_id = eval.get("DeploymentID", None)
-                break
-        else:
-            time.sleep(3)
+def is_unchanged(plan):
+    """Whether a plan (requested with `Diff`) shows no changes to the job.
 
-    return True, deployment_id
+    Nomad reports a diff of type "None" for identical jobs, a new or stopped
+    job always shows up as "Added" or "Edited".
+    """
+    diff = plan.get("Diff")
+    return bool(diff) and diff["Type"] == "None"
 
 
-def monitor_deployment(config, deployment_id):
-    click.echo(f"- Monitoring deployment {repr(deployment_id)}.")
-    while True:
-        response = config.client.get(f"/v1/deployment/{deployment_id}")
-        if response.status_code != 200:
-            raise utils.ApiError(response)
-        deployment = response.json()
-        status = deployment["Status"]
-
-        if status in ("failed", "cancelled"):
-            click.echo("\n" f"Deployment failed: {deployment['StatusDescription']}")
-            return False
-        elif status == "successful":
-            click.echo(f"- Deployment {repr(deployment_id)} completed successfully.")
-            return True
-        else:
-            time.sleep(3)
-            continue
+def echo_stream(echo, chunks, size=8192):
+    """Echo `chunks` as they are produced, batched into writes of `size`."""
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            echo("".join(buffer), nl=False)
+            buffer, length = [], 0
+    if buffer:
+        echo("".join(buffer), nl=False)
 
 
-def main():
+async def monitor_job(
+    config, job_id, eval_id, mode="blocking", follow_deployment=True, echo=click.echo
+):
+    from . import monitor
+
+    if mode == "events":
+        events = monitor.EventMonitor(config)
+        events.watch(job_id, eval_id, follow_deployment, echo)
+        return await events.run()
+
+    watch = monitor.Watch(job_id, eval_id, None, follow_deployment, echo)
+    return await watch.poll(config)
+
+
+@cli.command()
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False, resolve_path=True),
+    help="The Unix socket to listen on (defaults to $DOBBY_SOCKET or serve.sock "
+    "in the cache directory).",
+)
+def serve(socket_path):
+    """Run the commands of this user in a long running daemon.
+
+    While it runs, other invocations of dobby hand their command to it and
+    output what it returns. The daemon keeps connections to Nomad open as well
+    as compiled templates and loaded variable files in memory. Commands run
+    one at a time, others run in-process meanwhile. Set `DOBBY_NO_DAEMON` to
+    always run commands in-process.
+    """
+    import signal
+
+    path = socket_path or daemon.socket_path()
+    # Shut down (and remove the socket) on SIGTERM as well
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    with daemon.Server(path, run_cli) as server:
+        click.echo(f"Listening on {path}.", err=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def run_cli(args=None):
     color = None
     if str(os.environ.get("FORCE_COLOR", 0)).lower() in {"true", "yes", "1"}:
         color = True
-    return cli.main(prog_name="dobby", max_content_width=220, color=color)
+    return cli.main(args, prog_name="dobby", max_content_width=220, color=color)
+
+
+def main():
+    status = daemon.forward(sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
+    return run_cli()
@@ -1,5 +1,9 @@
+import asyncio
+import contextlib
+import copy
 import ssl
 import sys
+import threading
 from pathlib import Path
 from urllib.parse import urlparse
 
@@ -7,17 +11,177 @@ import click
 import httpx
 from httpx._config import DEFAULT_CIPHERS
 
-from . import utils
+from . import cache, utils
+from .hcl import ParseError
+from .timings import NO_TIMINGS, Timings, record, route
 
 
 class NomadSSLContext(ssl.SSLContext):
+    _hostname = None
+    _load = None
+    _loading = None
+    _load_error = None
+
     def set_hostname(self, hostname):
         self._hostname = hostname
 
+    def load_in_background(self, load):
+        """Call `load()` (ie loading CA bundles) in a thread.
+
+        The context waits for it before it is used, loading errors are raised
+        at that point as well.
+        """
+
+        def run():
+            try:
+                load()
+            except Exception as e:
+                self._load_error = e
+
+        self._loading = threading.Thread(target=run, daemon=True)
+        self._loading.start()
+
+    def load_lazily(self, load):
+        """Call `load()` when the context is first used, if ever."""
+        self._load = load
+
+    def wait_loaded(self):
+        if self._load is not None:
+            load, self._load = self._load, None
+            load()
+        if self._loading is not None:
+            self._loading.join()
+            if self._load_error is not None:
+                raise self._load_error
+
     def wrap_socket(self, *args, **kwargs):
-        kwargs["server_hostname"] = self._hostname
+        self.wait_loaded()
+        if self._hostname:
+            kwargs["server_hostname"] = self._hostname
         return super().wrap_socket(*args, **kwargs)
 
+    def wrap_bio(self, *args, **kwargs):
+        # Used by asyncio (and thus by `httpx.AsyncClient`)
+        self.wait_loaded()
+        if self._hostname:
+            kwargs["server_hostname"] = self._hostname
+        return super().wrap_bio(*args, **kwargs)
+
+
+class Target:
+    """A region and namespace to deploy to (None meaning the default)."""
+
+    def __init__(self, region=None, namespace=None):
+        self.region = region or None
+        self.namespace = namespace or None
+
+    def __repr__(self):
+        return f"Target({self.region!r}, {self.namespace!r})"
+
+    @property
+    def label(self):
+        return "/".join(filter(None, (self.region, self.namespace))) or "default"
+
+    @property
+    def params(self):
+        params = {}
+        if self.region:
+            params["region"] = self.region
+        if self.namespace:
+            params["namespace"] = self.namespace
+        return params
+
+
+def split_list(value):
+    """Split a comma separated option value, `[None]` if it is empty."""
+    items = [item.strip() for item in (value or "").split(",") if item.strip()]
+    return items or [None]
+
+
+class TargetClient(utils.ClientWrapper):
+    """Send requests through `client`, adding the params of a `Target`.
+
+    Targets share the client (and its connection pool), the params of the
+    target take precedence over those of the client.
+    """
+
+    def __init__(self, client, params):
+        super().__init__(client)
+        self.params = params
+
+    def _merge_params(self, kwargs):
+        params = httpx.QueryParams(self.params)
+        params.update(kwargs.get("params"))
+        kwargs["params"] = params
+        return kwargs
+
+    def request(self, method, url, **kwargs):
+        return self.client.request(method, url, **self._merge_params(kwargs))
+
+    def stream(self, method, url, **kwargs):
+        return self.client.stream(method, url, **self._merge_params(kwargs))
+
+
+class SharedClient(utils.ClientWrapper):
+    """A client kept open across commands (see `share_clients`)."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+# Clients by their settings, only set by `dobby serve`
+_shared_clients = None
+
+
+def share_clients(enabled=True):
+    """Reuse clients (and their connections) for configs with the same settings."""
+    global _shared_clients
+    _shared_clients = {} if enabled else None
+
+
+async def close_shared_clients():
+    clients = list((_shared_clients or {}).values())
+    for client in clients:
+        await client.aclose()
+
+
+class MeteredClient(utils.ClientWrapper):
+    """Measure the requests made through `client`.
+
+    Every request is recorded in a span of `timings` and its bytes are added
+    to `transfer_stats` (if set) once the response was read.
+    """
+
+    def __init__(self, client, timings, transfer_stats=None):
+        super().__init__(client)
+        self.timings = timings
+        self.transfer_stats = transfer_stats
+
+    async def request(self, method, url, **kwargs):
+        content = kwargs.get("content")
+        sent = len(content) if isinstance(content, bytes) else 0
+        with self.timings.span(f"http {method} {route(url)}"):
+            response = await self.client.request(method, url, **kwargs)
+            received = response.num_bytes_downloaded
+            record(requests=1, sent=sent, received=received)
+        if self.transfer_stats:
+            self.transfer_stats.count(
+                utils.decoded_size(content, kwargs.get("headers")),
+                sent,
+                len(response.content),
+                received,
+            )
+        return response
+
+    def stream(self, method, url, **kwargs):
+        # Streams are long-lived, only count them
+        with self.timings.span(f"http {method} {route(url)}"):
+            record(requests=1)
+        return self.client.stream(method, url, **kwargs)
+
 
 class Config:
     def __init__(
@@ -32,28 +196,89 @@ class Config:
         tls_server_name,
         tls_skip_verify=False,
         token=None,
+        wait_time=300,
+        poll_interval=3,
+        max_retries=8,
+        retry_deadline=120,
+        parse_cache=True,
+        parser="remote",
+        gzip_requests=False,
+        transfer_stats=False,
+        timings=False,
+        timings_file=None,
     ):
+        self.address = address
+        self.wait_time = wait_time
+        self.poll_interval = poll_interval
+        self.retry_policy = utils.RetryPolicy(max_retries, retry_deadline)
+        self.parse_cache = cache.ParseCache() if parse_cache else None
+        self.parser = parser
+        self.gzip_requests = gzip_requests
+        self.transfer_stats = utils.TransferStats() if transfer_stats else None
+        self.print_timings = timings
+        self.timings_file = Path(timings_file) if timings_file else None
+        if timings or timings_file:
+            self.timings = Timings()
+        else:
+            self.timings = NO_TIMINGS
+        self._server_version = None
+        self._server_version_lock = None
+
         headers = {}
         if token:
             headers["X-Nomad-Token"] = token
 
-        params = {}
-        if region:
-            params["region"] = region
-        if namespace:
-            params["namespace"] = namespace
+        # Region and namespace accept comma separated lists, every combination
+        # is a target (see `for_target`)
+        self.targets = [
+            Target(r, n) for r in split_list(region) for n in split_list(namespace)
+        ]
+        self.target = self.targets[0] if len(self.targets) == 1 else None
+        params = self.target.params if self.target else {}
 
-        verify = self.ssl_context(
-            ca_cert or ca_path, client_cert, client_key, tls_skip_verify
-        )
-        verify.set_hostname(tls_server_name or urlparse(address).hostname)
+        tls = (ca_cert or ca_path, client_cert, client_key, tls_skip_verify)
+        server_name = tls_server_name or urlparse(address).hostname
+        if _shared_clients is not None:
+            key = (address, token, tuple(params.items()), tls, server_name)
+            client = _shared_clients.get(key)
+            if client is None:
+                client = self.create_client(address, headers, params, tls, server_name)
+                _shared_clients[key] = client
+            self.client = SharedClient(client)
+        else:
+            self.client = self.create_client(address, headers, params, tls, server_name)
+        if self.timings is not NO_TIMINGS or self.transfer_stats:
+            self.client = MeteredClient(self.client, self.timings, self.transfer_stats)
 
-        self.client = httpx.Client(
-            base_url=address, headers=headers, params=params, verify=verify
+    def create_client(self, address, headers, params, tls, server_name):
+        # Plain http:// addresses only need TLS when redirected to https://
+        https = urlparse(address).scheme == "https"
+        verify = self.ssl_context(*tls, background=https)
+        if https:
+            verify.set_hostname(server_name)
+
+        # httpx asks for gzip compressed responses by default
+        return httpx.AsyncClient(
+            base_url=address,
+            headers=headers,
+            params=params,
+            verify=verify,
         )
 
+    def for_target(self, target):
+        """Return a copy of the config sending its requests to `target`."""
+        config = copy.copy(self)
+        config.target = target
+        config.client = TargetClient(self.client, target.params)
+        return config
+
     def ssl_context(
-        self, ca_bundle, client_cert=None, client_key=None, tls_skip_verify=False
+        self,
+        ca_bundle,
+        client_cert=None,
+        client_key=None,
+        tls_skip_verify=False,
+        background=True,
     ):
         context = NomadSSLContext(ssl.PROTOCOL_TLS)
         context.options |= ssl.OP_NO_SSLv2
@@ -66,25 +291,98 @@ class Config:
         context.verify_mode = ssl.CERT_REQUIRED
         context.check_hostname = True
 
-        if ca_bundle:
-            ca_bundle = Path(ca_bundle)
-            if ca_bundle.is_file():
-                context.load_verify_locations(cafile=str(ca_bundle))
-            elif ca_bundle.is_dir():
-                context.load_verify_locations(capath=str(ca_bundle))
-        else:
-            context.load_default_certs(ssl.Purpose.SERVER_AUTH)
+        # Loading the CA bundle takes a while, it overlaps with ie rendering
+        def load():
+            if ca_bundle:
+                path = Path(ca_bundle)
+                if path.is_file():
+                    context.load_verify_locations(cafile=str(path))
+                elif path.is_dir():
+                    context.load_verify_locations(capath=str(path))
+            else:
+                context.load_default_certs(ssl.Purpose.SERVER_AUTH)
 
-        if tls_skip_verify:
-            context.check_hostname = False
-            context.verify_mode = ssl.CERT_NONE
-        if client_cert and client_key:
-            context.load_cert_chain(client_cert, client_key)
+            if tls_skip_verify:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            if client_cert and client_key:
+                context.load_cert_chain(client_cert, client_key)
+
+        if background:
+            context.load_in_background(load)
+        else:
+            context.load_lazily(load)
         return context
 
-    def parse_hcl_or_exit(self, job_spec):
+    async def server_version(self):
+        """Return the version of the Nomad agent or None if it is unknown."""
+        if self._server_version_lock is None:
+            self._server_version_lock = asyncio.Lock()
+        async with self._server_version_lock:
+            if self._server_version is None:
+                self._server_version = await self._fetch_server_version()
+        return self._server_version or None
+
+    async def _fetch_server_version(self):
+        if self.parse_cache:
+            version = self.parse_cache.get_version(self.address)
+            if version is not None:
+                return version
+
+        # Failures (ie missing ACL permissions) are remembered as well
+        response = await self.client.get("/v1/agent/self")
+        version = ""
+        if response.status_code == 200:
+            try:
+                version = response.json()["member"]["Tags"]["build"]
+            except (KeyError, TypeError, ValueError):
+                pass
+        if self.parse_cache:
+            self.parse_cache.set_version(self.address, version)
+        return version
+
+    async def warm_up(self):
+        """Connect to Nomad, ie while templates are rendered.
+
+        The connection (including the TLS handshake) is reused by the requests
+        which follow. If the version of the server is needed for the parse
+        cache but not yet known it is fetched instead. Errors are ignored,
+        they surface again with the actual requests.
+        """
+        try:
+            with self.timings.span("connect"):
+                if (
+                    self.parser == "remote"
+                    and self.parse_cache
+                    and self.parse_cache.get_version(self.address) is None
+                ):
+                    await self.server_version()
+                else:
+                    await self.client.get("/v1/status/leader")
+        except (httpx.HTTPError, OSError):
+            pass
+
+    @contextlib.asynccontextmanager
+    async def warming_up(self, enabled=True):
+        """Run `warm_up` in the background of the block (unless disabled).
+
+        The task is passed to the block which awaits it before it makes its
+        first request.
+        """
+        task = asyncio.ensure_future(self.warm_up()) if enabled else None
+        try:
+            yield task
+        finally:
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+    async def parse_hcl_or_exit(self, job_spec):
         try:
-            return utils.hcl_to_json(self, job_spec)
+            return await utils.hcl_to_json(self, job_spec)
+        except ParseError as e:
+            click.secho(str(e), fg="red")
+            sys.exit(1)
         except utils.ApiError as e:
             if e.response.status_code == 400:
                 click.secho(e.response.text, fg="red")
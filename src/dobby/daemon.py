@@ -0,0 +1,234 @@
+"""
+A local daemon running the commands of its user (see `dobby serve`).
+
+The daemon keeps its state between commands: HTTP clients (with their TLS
+contexts and open connections) are shared by all commands with the same
+connection settings, templates are only compiled once and variable files
+stay loaded. All commands run on one event loop so the clients outlive them.
+
+`dobby` hands its arguments, working directory and environment to the daemon
+listening on `socket_path()` and streams the output back, if none is running
+the command runs in-process. Commands are run one at a time, as they change
+the working directory and the environment of the daemon: while one runs (ie
+a long deployment), the daemon refuses further commands and those run
+in-process instead. So does a daemon of another version of dobby.
+
+The protocol is a JSON request line followed by frames from the daemon: a
+channel (`o` for stdout, `e` for stderr, `x` for the exit status, `r` if the
+command was refused) and the length of the payload.
+"""
+
+import io
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import traceback
+from pathlib import Path
+
+import click
+
+from . import __version__, cache
+
+FRAME_HEADER = struct.Struct("!cI")
+
+
+def socket_path():
+    if "DOBBY_SOCKET" in os.environ:
+        return os.environ["DOBBY_SOCKET"]
+    return str(cache.cache_dir() / "serve.sock")
+
+
+def forward(args, path=None, stdout=None, stderr=None):
+    """Run the command given by `args` in the daemon, returns its exit status.
+
+    Returns None if no daemon is running (or `DOBBY_NO_DAEMON` is set) or if
+    it refused the command, ie as it is busy with another one.
+    """
+    if os.environ.get("DOBBY_NO_DAEMON") or args[:1] == ["serve"]:
+        return None
+    path = path or socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        # The environment (ie NOMAD_TOKEN) is only handed to our own daemon
+        if os.stat(path).st_uid != os.getuid():
+            sock.close()
+            return None
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+
+    stdout = stdout or sys.stdout.buffer
+    stderr = stderr or sys.stderr.buffer
+    request = {
+        "version": __version__,
+        "args": args,
+        "cwd": os.getcwd(),
+        "env": dict(os.environ),
+        "tty": [stdout.isatty(), stderr.isatty()],
+    }
+    with sock, sock.makefile("rb") as fh:
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        while True:
+            header = fh.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                stderr.write(b"Lost the connection to `dobby serve`.\n")
+                return 1
+            channel, size = FRAME_HEADER.unpack(header)
+            payload = fh.read(size)
+            if channel == b"r":
+                return None
+            if channel == b"x":
+                return int(payload)
+            out = stdout if channel == b"o" else stderr
+            out.write(payload)
+            out.flush()
+
+
+class FrameWriter(io.RawIOBase):
+    """A binary stream sending everything written as frames of `channel`."""
+
+    def __init__(self, handler, channel, tty):
+        self.handler = handler
+        self.channel = channel
+        self.tty = tty
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return self.tty
+
+    def write(self, data):
+        self.handler.send(self.channel, bytes(data))
+        return len(data)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        # Output is written from the event loop as well as from worker threads
+        self.lock = threading.Lock()
+
+    def send(self, channel, payload):
+        with self.lock:
+            self.request.sendall(FRAME_HEADER.pack(channel, len(payload)) + payload)
+
+    def stream(self, channel, tty):
+        writer = FrameWriter(self, channel, tty)
+        return io.TextIOWrapper(
+            writer, encoding="utf-8", errors="replace", write_through=True
+        )
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            if request.get("version") != __version__:
+                self.send(b"r", b"version")
+                return
+            if not self.server.running.acquire(blocking=False):
+                self.send(b"r", b"busy")
+                return
+            try:
+                stdout = self.stream(b"o", request["tty"][0])
+                stderr = self.stream(b"e", request["tty"][1])
+                status = run_request(self.server.run, request, stdout, stderr)
+            finally:
+                # Released first, the next command may follow right away
+                self.server.running.release()
+            self.send(b"x", str(status).encode())
+        except (OSError, ValueError):
+            # The client went away (ie on ^C) or sent garbage
+            pass
+
+
+def run_request(run, request, stdout, stderr):
+    """Run a command as requested by `forward`, returns its exit status."""
+    saved = sys.stdout, sys.stderr, dict(os.environ), os.getcwd()
+    sys.stdout, sys.stderr = stdout, stderr
+    try:
+        os.environ.clear()
+        os.environ.update(request["env"])
+        os.chdir(request["cwd"])
+        run(request["args"])
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout, sys.stderr = saved[:2]
+        os.environ.clear()
+        os.environ.update(saved[2])
+        os.chdir(saved[3])
+    return 0
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Accept commands on the Unix socket at `path`, `run(args)` runs them.
+
+    Connections are handled in threads, so further commands are refused
+    instead of waiting while one runs.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, run):
+        import asyncio
+
+        from . import config, runner
+
+        self.run = run
+        self.running = threading.Lock()
+        remove_stale_socket(path)
+        cache.make_dirs(Path(path).parent)
+        # Only the user may connect, the daemon runs whatever it is sent
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, Handler)
+        finally:
+            os.umask(umask)
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        config.share_clients()
+        runner.share_loop(self.loop)
+
+    def server_close(self):
+        import asyncio
+
+        from . import config, runner
+
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+        runner.share_loop(None)
+        closing = config.close_shared_clients()
+        asyncio.run_coroutine_threadsafe(closing, self.loop).result()
+        config.share_clients(False)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+def remove_stale_socket(path):
+    """Remove the socket of a daemon which did not shut down cleanly."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except FileNotFoundError:
+            return
+        except ConnectionRefusedError:
+            os.unlink(path)
+            return
+    raise click.ClickException(f"`dobby serve` is already listening on {path}.")
@@ -4,6 +4,9 @@ The contents of this file are a python translation of nomad/command/job_plan.go
 TODO: Figure out license?
 """
 
+import hashlib
+import re
+
 import click
 
 pm = click.style("+/- ", fg="yellow")
@@ -54,36 +57,119 @@ def get_longest_prefixes(fields, objects):
     return longest_field, longest_marker
 
 
-def format_job_diff(job, verbose=False):
-    fields = job[FIELDS] or []
-    objects = job[OBJECTS] or []
+class DiffOptions:
+    """Limits for printing (large) diffs, the defaults print everything.
+
+    * depth: Nesting level of objects to print, deeper objects are collapsed.
+    * max_fields: Maximum number of fields printed per job/group/task/object.
+    * max_value: Values longer than this are truncated (and a hash appended).
+    * filters: Glob patterns, only fields with a matching path are printed
+      (see `iter_changes` for the format of paths).
+    """
+
+    def __init__(self, depth=None, max_fields=None, max_value=None, filters=()):
+        self.depth = depth
+        self.max_fields = max_fields
+        self.max_value = max_value
+        self.filters = tuple(filters)
+        # Only `*` and `?` are special, paths contain brackets (ie `Task[web]`)
+        patterns = (
+            re.escape(f).replace(r"\*", ".*").replace(r"\?", ".") for f in self.filters
+        )
+        self._filter_re = re.compile(r"(?:{})\Z".format("|".join(patterns)))
+
+    def matches(self, path):
+        return bool(self._filter_re.match(path))
+
+    def subtree_matches(self, diff, path):
+        if self.matches(path.rstrip(".")):
+            return True
+        for field in diff[FIELDS] or []:
+            if self.matches(f"{path}{field[NAME]}"):
+                return True
+        if any(
+            self.subtree_matches(object, f"{path}{object[NAME]}.")
+            for object in diff[OBJECTS] or []
+        ):
+            return True
+        return any(
+            self.subtree_matches(task, f"{path}Task[{task[NAME]}].")
+            for task in diff.get(TASKS) or []
+        )
+
+    def select_nested(self, diffs, path, kind):
+        """Return the task groups or tasks (as per `kind`) of `diffs` to print."""
+        if not self.filters or self.matches(path.rstrip(".")):
+            return diffs
+        return [
+            diff
+            for diff in diffs
+            if self.subtree_matches(diff, f"{path}{kind}[{diff[NAME]}].")
+        ]
+
+    def select(self, diff, path):
+        """Return the fields and objects of `diff` to print and the number of
+        fields left out."""
+        fields = diff[FIELDS] or []
+        objects = diff[OBJECTS] or []
+        if self.filters and not self.matches(path.rstrip(".")):
+            fields = [f for f in fields if self.matches(f"{path}{f[NAME]}")]
+            objects = [
+                o for o in objects if self.subtree_matches(o, f"{path}{o[NAME]}.")
+            ]
+        hidden = 0
+        if self.max_fields is not None and len(fields) > self.max_fields:
+            hidden = len(fields) - self.max_fields
+            fields = fields[: self.max_fields]
+        return fields, objects, hidden
+
+    def value(self, value):
+        value = str(value)
+        if self.max_value is None or len(value) <= self.max_value:
+            return value
+        digest = hashlib.sha256(value.encode()).hexdigest()[:12]
+        return f"{value[:self.max_value]}... ({len(value)} chars, sha256:{digest})"
+
+
+NO_LIMITS = DiffOptions()
+
+
+def format_job_diff(job, verbose=False, options=NO_LIMITS):
+    return "".join(iter_job_diff(job, verbose, options))
+
+
+def iter_job_diff(job, verbose=False, options=NO_LIMITS):
+    """Yield the formatted job diff piece by piece (see `format_job_diff`)."""
+    fields, objects, hidden = options.select(job, "")
+    task_groups = options.select_nested(job[TASK_GROUPS], "", "TaskGroup")
 
     marker, _ = get_diff_string(job)
     text = bold(f"Job: {q(job[ID])}")
-    out = f"{marker}{text}\n"
+    yield f"{marker}{text}\n"
 
     longest_field, longest_marker = get_longest_prefixes(fields, objects)
-    for tg in job[TASK_GROUPS]:
+    for tg in task_groups:
         longest_marker = max(get_diff_string(tg)[1], longest_marker)
 
     if job[TYPE] == EDITED or verbose:
-        fo = aligned_field_and_objects(
-            fields, objects, 0, longest_field, longest_marker
+        yield from iter_aligned_field_and_objects(
+            fields, objects, 0, longest_field, longest_marker, "", hidden, options
         )
-        out += fo
-        if fo:
-            out += "\n"
+        if fields or objects or hidden:
+            yield "\n"
 
-    for tg in job[TASK_GROUPS]:
+    for tg in task_groups:
         m_length = get_diff_string(tg)[1]
         k_prefix = longest_marker - m_length
-        out += format_task_group_diff(tg, k_prefix, verbose)
-        out += "\n"
+        yield from iter_task_group_diff(tg, k_prefix, verbose, options)
+        yield "\n"
 
-    return out
 
+def format_task_group_diff(task_group, tg_prefix, verbose, options=NO_LIMITS):
+    return "".join(iter_task_group_diff(task_group, tg_prefix, verbose, options))
 
-def format_task_group_diff(task_group, tg_prefix, verbose):
+
+def iter_task_group_diff(task_group, tg_prefix, verbose, options=NO_LIMITS):
     marker = get_diff_string(task_group)[0]
     text = bold(f"Task Group: {q(task_group[NAME])}")
     out = f"{marker}{' ' * tg_prefix}{text}"
@@ -111,10 +197,11 @@ def format_task_group_diff(task_group, tg_prefix, verbose):
         out += " ({})\n".format(", ".join(updates))
     else:
         out += "\n"
+    yield out
 
-    fields = task_group[FIELDS] or []
-    objects = task_group[OBJECTS] or []
-    tasks = task_group[TASKS] or []
+    path = f"TaskGroup[{task_group[NAME]}]."
+    fields, objects, hidden = options.select(task_group, path)
+    tasks = options.select_nested(task_group[TASKS] or [], path, "Task")
 
     longest_field, longest_marker = get_longest_prefixes(fields, objects)
     for task in tasks:
@@ -122,22 +209,39 @@ def format_task_group_diff(task_group, tg_prefix, verbose):
 
     sub_start_prefix = tg_prefix + 2
     if task_group[TYPE] == EDITED or verbose:
-        fo = aligned_field_and_objects(
-            fields, objects, sub_start_prefix, longest_field, longest_marker
+        yield from iter_aligned_field_and_objects(
+            fields,
+            objects,
+            sub_start_prefix,
+            longest_field,
+            longest_marker,
+            path,
+            hidden,
+            options,
         )
-        out += fo
-        if fo:
-            out += "\n"
+        if fields or objects or hidden:
+            yield "\n"
 
     for task in tasks:
         m_length = get_diff_string(task)[1]
         prefix = longest_marker - m_length
-        out += format_task_diff(task, sub_start_prefix, prefix, verbose) + "\n"
+        yield from iter_task_diff(
+            task, sub_start_prefix, prefix, verbose, path, options
+        )
+        yield "\n"
 
-    return out
+
+def format_task_diff(
+    task, start_prefix, task_prefix, verbose, path="", options=NO_LIMITS
+):
+    return "".join(
+        iter_task_diff(task, start_prefix, task_prefix, verbose, path, options)
+    )
 
 
-def format_task_diff(task, start_prefix, task_prefix, verbose):
+def iter_task_diff(
+    task, start_prefix, task_prefix, verbose, path="", options=NO_LIMITS
+):
     marker = get_diff_string(task)[0]
     text = bold(f"Task: {q(task[NAME])}")
     out = f"{' ' * start_prefix}{marker}{' ' * task_prefix}{text}"
@@ -146,31 +250,40 @@ def format_task_diff(task, start_prefix, task_prefix, verbose):
 
     # What is a none task?
     if task[TYPE] == "None" or task[TYPE] is None:
-        return out
+        yield out
+        return
     elif task[TYPE] in (ADDED, DELETED) and not verbose:
-        return out
-    else:
-        out += "\n"
+        yield out
+        return
 
-    fields = task[FIELDS] or []
-    objects = task[OBJECTS] or []
+    path = f"{path}Task[{task[NAME]}]."
+    fields, objects, hidden = options.select(task, path)
+    if options.filters and not (fields or objects or hidden):
+        yield out
+        return
+    yield out + "\n"
 
     sub_start_prefix = start_prefix + 2
     longest_field, longest_marker = get_longest_prefixes(fields, objects)
 
-    out += aligned_field_and_objects(
-        fields, objects, sub_start_prefix, longest_field, longest_marker
+    yield from iter_aligned_field_and_objects(
+        fields,
+        objects,
+        sub_start_prefix,
+        longest_field,
+        longest_marker,
+        path,
+        hidden,
+        options,
     )
 
-    return out
-
 
-def format_field_diff(diff, start_prefix, key_prefix, value_prefix):
+def format_field_diff(diff, start_prefix, key_prefix, value_prefix, options=NO_LIMITS):
     marker = get_diff_string(diff)[0]
     out = f"{' ' * start_prefix}{marker}{' ' * key_prefix}{diff[NAME]}: {' ' * value_prefix}"
 
-    old = q(diff[OLD])
-    new = q(diff[NEW])
+    old = q(options.value(diff[OLD]))
+    new = q(options.value(diff[NEW]))
 
     out += {ADDED: new, DELETED: old, EDITED: f"{old} => {new}"}.get(diff[TYPE], new)
 
@@ -180,22 +293,40 @@ def format_field_diff(diff, start_prefix, key_prefix, value_prefix):
     return out
 
 
-def format_object_diff(diff, start_prefix, key_prefix):
-    fields = diff[FIELDS] or []
-    objects = diff[OBJECTS] or []
+def format_object_diff(diff, start_prefix, key_prefix, path="", options=NO_LIMITS):
+    return "".join(iter_object_diff(diff, start_prefix, key_prefix, path, options))
+
 
+def iter_object_diff(
+    diff, start_prefix, key_prefix, path="", options=NO_LIMITS, depth=0
+):
     start = " " * start_prefix
     marker, marker_len = get_diff_string(diff)
-    out = f"{start}{marker}{' ' * key_prefix}{diff[NAME]} {{" + "\n"
+    if options.depth is not None and depth >= options.depth:
+        # Collapsed, the subtree is not looked at at all
+        yield f"{start}{marker}{' ' * key_prefix}{diff[NAME]} {{ ... }}"
+        return
+
+    path = f"{path}{diff[NAME]}."
+    fields, objects, hidden = options.select(diff, path)
+    yield f"{start}{marker}{' ' * key_prefix}{diff[NAME]} {{" + "\n"
 
     longest_field, longest_marker = get_longest_prefixes(fields, objects)
     sub_start_prefix = start_prefix + key_prefix + 2
-    out += aligned_field_and_objects(
-        fields, objects, sub_start_prefix, longest_field, longest_marker
+    yield from iter_aligned_field_and_objects(
+        fields,
+        objects,
+        sub_start_prefix,
+        longest_field,
+        longest_marker,
+        path,
+        hidden,
+        options,
+        depth + 1,
     )
 
     end_prefix = " " * (start_prefix + marker_len + key_prefix)
-    return "{}\n{}".format(out, end_prefix) + "}"
+    yield "\n{}".format(end_prefix) + "}"
 
 
 def format_alloc_metrics(metrics, scores, prefix):
@@ -309,28 +440,112 @@ def color_annotations(annotations):
 
 def aligned_field_and_objects(
     fields, objects, start_prefix, longest_field, longest_marker
+):
+    return "".join(
+        iter_aligned_field_and_objects(
+            fields, objects, start_prefix, longest_field, longest_marker
+        )
+    )
+
+
+def iter_aligned_field_and_objects(
+    fields,
+    objects,
+    start_prefix,
+    longest_field,
+    longest_marker,
+    path="",
+    hidden=0,
+    options=NO_LIMITS,
+    depth=0,
 ):
     fields = fields or []
     objects = objects or []
 
-    out = ""
     for i, field in enumerate(fields):
         m_length = get_diff_string(field)[1]
         k_prefix = longest_marker - m_length
         v_prefix = longest_field - len(field[NAME])
-        out += format_field_diff(field, start_prefix, k_prefix, v_prefix)
+        yield format_field_diff(field, start_prefix, k_prefix, v_prefix, options)
 
         # Avoid a dangling new line
-        if i + 1 != len(fields) or objects:
-            out += "\n"
+        if i + 1 != len(fields) or objects or hidden:
+            yield "\n"
+
+    if hidden:
+        noun = "field" if hidden == 1 else "fields"
+        yield f"{' ' * (start_prefix + longest_marker)}... ({hidden} more {noun})"
+        if objects:
+            yield "\n"
 
     for i, object in enumerate(objects):
         m_length = get_diff_string(object)[1]
         k_prefix = longest_marker - m_length
-        out += format_object_diff(object, start_prefix, k_prefix)
+        yield from iter_object_diff(
+            object, start_prefix, k_prefix, path, options, depth
+        )
 
         # Avoid a dangling new line
         if i + 1 != len(objects):
-            out += "\n"
+            yield "\n"
+
+
+ALLOC_METRICS = (
+    "CoalescedFailures",
+    "NodesEvaluated",
+    "NodesFiltered",
+    "NodesAvailable",
+    "ClassFiltered",
+    "ConstraintFiltered",
+    "NodesExhausted",
+    "ClassExhausted",
+    "DimensionExhausted",
+    "QuotaExhausted",
+)
+
+
+def plan_summary(resp, job):
+    """Summarize a plan response for machine consumption (no styling)."""
+    diff = resp["Diff"] or {}
+    failed_tg_allocs = resp["FailedTGAllocs"] or {}
+    return {
+        "job": job[ID],
+        "type": diff.get(TYPE, "None"),
+        "job_modify_index": resp["JobModifyIndex"],
+        "task_groups": {
+            tg[NAME]: {"type": tg[TYPE], "updates": tg[UPDATES] or {}}
+            for tg in diff.get(TASK_GROUPS) or []
+        },
+        "changes": list(iter_changes(diff)),
+        "failed_allocations": {
+            tg: {k: metrics[k] for k in ALLOC_METRICS if k in metrics}
+            for tg, metrics in sorted(failed_tg_allocs.items())
+        },
+        "warnings": resp.get("Warnings") or "",
+    }
 
-    return out
+
+def iter_changes(diff, path=""):
+    """Yield the changed fields of a diff with their (dotted) path."""
+    for field in diff.get(FIELDS) or []:
+        if field[TYPE] != "None":
+            yield {
+                "path": f"{path}{field[NAME]}",
+                "type": field[TYPE],
+                "old": field[OLD],
+                "new": field[NEW],
+                "annotations": field[ANNOTATIONS] or [],
+            }
+    for object in diff.get(OBJECTS) or []:
+        yield from iter_changes(object, f"{path}{object[NAME]}.")
+    for tg in diff.get(TASK_GROUPS) or []:
+        yield from iter_changes(tg, f"{path}TaskGroup[{tg[NAME]}].")
+    for task in diff.get(TASKS) or []:
+        task_path = f"{path}Task[{task[NAME]}]"
+        if task[TYPE] not in ("None", None):
+            yield {
+                "path": task_path,
+                "type": task[TYPE],
+                "annotations": task[ANNOTATIONS] or [],
+            }
+        yield from iter_changes(task, f"{task_path}.")
@@ -0,0 +1,327 @@
+"""
+A parser for HCL (version 1) as used by Nomad job specifications.
+
+The result mirrors the AST of github.com/hashicorp/hcl: an `ObjectList` of
+`ObjectItem`s, each with one or more keys and a value which is either an
+`ObjectList` (for `{ ... }`), a python list or a literal.
+"""
+
+import re
+
+
+class ParseError(Exception):
+    def __init__(self, message, line=None):
+        if line is not None:
+            message = f"At {line}: {message}"
+        super().__init__(message)
+
+
+class ObjectItem:
+    __slots__ = ("keys", "value", "line")
+
+    def __init__(self, keys, value, line):
+        self.keys = keys
+        self.value = value
+        self.line = line
+
+    def __repr__(self):
+        return f"ObjectItem({self.keys!r}, {self.value!r})"
+
+
+class ObjectList(list):
+    def filter(self, *keys):
+        """Return the items starting with `keys`, with those keys stripped.
+
+        Like in HCL keys are compared case-insensitively.
+        """
+        n = len(keys)
+        keys = [k.lower() for k in keys]
+        return ObjectList(
+            ObjectItem(item.keys[n:], item.value, item.line)
+            for item in self
+            if len(item.keys) >= n and [k.lower() for k in item.keys[:n]] == keys
+        )
+
+    def children(self):
+        """Return the items which have further keys (ie `key "name" { }`)."""
+        return ObjectList(item for item in self if item.keys)
+
+    def elem(self):
+        """Return the items which have no further keys (ie `key = value`)."""
+        return ObjectList(item for item in self if not item.keys)
+
+
+IDENT_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_\-.:]*")
+NUMBER_RE = re.compile(
+    r"-?(0[xX][0-9a-fA-F]+|[0-9]+(\.[0-9]+)?([eE][+-]?[0-9]+)?)(?![A-Za-z0-9_])"
+)
+HEREDOC_RE = re.compile(r"<<(-?)([A-Za-z_][A-Za-z0-9_\-]*)[ \t]*\r?\n")
+ESCAPES = {
+    "a": "\a",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+    "v": "\v",
+    "\\": "\\",
+    '"': '"',
+}
+PUNCTUATION = {"{", "}", "[", "]", "=", ","}
+
+
+def tokenize(src):
+    pos, line, length = 0, 1, len(src)
+    while pos < length:
+        c = src[pos]
+        if c == "\n":
+            line += 1
+            pos += 1
+        elif c in " \t\r":
+            pos += 1
+        elif c == "#" or src.startswith("//", pos):
+            end = src.find("\n", pos)
+            pos = length if end == -1 else end
+        elif src.startswith("/*", pos):
+            end = src.find("*/", pos + 2)
+            if end == -1:
+                raise ParseError("comment not terminated", line)
+            line += src.count("\n", pos, end)
+            pos = end + 2
+        elif c in PUNCTUATION:
+            yield c, c, line
+            pos += 1
+        elif c == '"':
+            value, end = scan_string(src, pos + 1, line)
+            yield "STRING", value, line
+            line += src.count("\n", pos, end)
+            pos = end
+        elif src.startswith("<<", pos):
+            value, end = scan_heredoc(src, pos, line)
+            yield "STRING", value, line
+            line += src.count("\n", pos, end)
+            pos = end
+        elif c == "-" or c.isdigit():
+            match = NUMBER_RE.match(src, pos)
+            if not match:
+                raise ParseError(f"illegal char {c!r}", line)
+            yield "NUMBER", parse_number(match.group(0), line), line
+            pos = match.end()
+        else:
+            match = IDENT_RE.match(src, pos)
+            if not match:
+                raise ParseError(f"illegal char {c!r}", line)
+            value = match.group(0)
+            if value in ("true", "false"):
+                yield "BOOL", value == "true", line
+            else:
+                yield "IDENT", value, line
+            pos = match.end()
+    yield "EOF", None, line
+
+
+def parse_number(text, line):
+    digits = text.lstrip("-")
+    sign = -1 if text.startswith("-") else 1
+    if digits[:2] in ("0x", "0X"):
+        return sign * int(digits[2:], 16)
+    if any(c in digits for c in ".eE"):
+        return sign * float(digits)
+    if len(digits) > 1 and digits.startswith("0"):
+        try:
+            return sign * int(digits, 8)
+        except ValueError:
+            raise ParseError(f"invalid octal number {text!r}", line)
+    return sign * int(digits)
+
+
+def scan_string(src, pos, line):
+    """Scan a quoted string starting after the opening quote.
+
+    Interpolations (`${ ... }`) are kept verbatim, just like HCL does.
+    """
+    out = []
+    length = len(src)
+    while pos < length:
+        c = src[pos]
+        if c == '"':
+            return "".join(out), pos + 1
+        elif c == "\n":
+            raise ParseError("literal not terminated", line)
+        elif src.startswith("${", pos):
+            end = scan_interpolation(src, pos + 2, line)
+            out.append(src[pos:end])
+            pos = end
+        elif c == "\\":
+            pos += 1
+            c = src[pos : pos + 1]
+            if c in ESCAPES:
+                out.append(ESCAPES[c])
+                pos += 1
+            elif c in ("u", "U"):
+                size = 4 if c == "u" else 8
+                code = src[pos + 1 : pos + 1 + size]
+                try:
+                    out.append(chr(int(code, 16)))
+                except ValueError:
+                    raise ParseError("invalid unicode escape", line)
+                pos += 1 + size
+            else:
+                raise ParseError(f"unknown escape sequence \\{c}", line)
+        else:
+            out.append(c)
+            pos += 1
+    raise ParseError("literal not terminated", line)
+
+
+def scan_interpolation(src, pos, line):
+    depth = 1
+    while pos < len(src):
+        c = src[pos]
+        if c == '"':
+            _, pos = scan_string(src, pos + 1, line)
+            continue
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return pos + 1
+        pos += 1
+    raise ParseError("interpolation not terminated", line)
+
+
+def scan_heredoc(src, pos, line):
+    match = HEREDOC_RE.match(src, pos)
+    if not match:
+        raise ParseError("heredoc expected marker", line)
+    indented, anchor = match.group(1) == "-", match.group(2)
+
+    lines = []
+    pos = match.end()
+    while pos < len(src):
+        end = src.find("\n", pos)
+        end = len(src) if end == -1 else end
+        current = src[pos:end].rstrip("\r")
+        stripped = current.lstrip(" \t") if indented else current
+        if stripped == anchor:
+            prefix = current[: len(current) - len(anchor)]
+            return unindent_heredoc(lines, prefix if indented else None), end
+        lines.append(current)
+        pos = end + 1
+    raise ParseError("heredoc not terminated", line)
+
+
+def unindent_heredoc(lines, prefix):
+    if prefix is None or not all(line.startswith(prefix) for line in lines):
+        return "".join(line + "\n" for line in lines)
+    return "".join(line[len(prefix) :] + "\n" for line in lines)
+
+
+class Parser:
+    def __init__(self, src):
+        self.tokens = list(tokenize(src))
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos]
+
+    def next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def expect(self, kind):
+        token = self.next()
+        if token[0] != kind:
+            raise ParseError(f"expected {kind!r}, got {token[1]!r}", token[2])
+        return token
+
+    def object_list(self, end):
+        items = ObjectList()
+        while self.peek()[0] != end:
+            items.append(self.object_item())
+            if self.peek()[0] == ",":
+                self.next()
+        return items
+
+    def object_item(self):
+        keys = []
+        line = self.peek()[2]
+        while self.peek()[0] in ("IDENT", "STRING"):
+            keys.append(self.next()[1])
+        if not keys:
+            kind, value, line = self.peek()
+            raise ParseError(f"expected key, got {value!r}", line)
+
+        kind, value, line = self.next()
+        if kind == "=":
+            if len(keys) > 1:
+                raise ParseError(f"nested object expected: LBRACE got: {kind}", line)
+            return ObjectItem(keys, self.value(), line)
+        elif kind == "{":
+            value = self.object_list("}")
+            self.expect("}")
+            return ObjectItem(keys, value, line)
+        raise ParseError(f"key {keys[-1]!r} expected start of object or '='", line)
+
+    def value(self):
+        kind, value, line = self.next()
+        if kind in ("STRING", "NUMBER", "BOOL"):
+            return value
+        elif kind == "{":
+            value = self.object_list("}")
+            self.expect("}")
+            return value
+        elif kind == "[":
+            values = []
+            while self.peek()[0] != "]":
+                values.append(self.value())
+                if self.peek()[0] != ",":
+                    break
+                self.next()
+            self.expect("]")
+            return values
+        raise ParseError(f"unexpected token while parsing value: {value!r}", line)
+
+    def parse(self):
+        items = self.object_list("EOF")
+        self.expect("EOF")
+        return items
+
+
+def parse(src):
+    """Parse HCL source into an `ObjectList`."""
+    return Parser(src).parse()
+
+
+def decode(value, in_map=False):
+    """Decode a value like `hcl.DecodeObject` into an `interface{}` would.
+
+    Objects are turned into dictionaries at the root and within lists, but
+    into lists of dictionaries when nested in another object.
+    """
+    if isinstance(value, ObjectList):
+        result = decode_map(value)
+        return [result] if in_map else result
+    elif isinstance(value, list):
+        return [decode(v) for v in value]
+    return value
+
+
+def decode_map(items):
+    result = {}
+    done = set()
+    for item in items:
+        key = item.keys[0]
+        if key in done:
+            continue
+        if len(item.keys) > 1:
+            done.add(key)
+            result[key] = [
+                decode_map(ObjectList([i])) if i.keys else decode(i.value)
+                for i in items.filter(key)
+            ]
+        else:
+            result[key] = decode(item.value, in_map=True)
+    return result
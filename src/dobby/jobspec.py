@@ -0,0 +1,958 @@
+"""
+Convert HCL (version 1) job specifications into the job structure returned by
+Nomad's `/v1/jobs/parse` endpoint.
+
+The contents of this file are a python translation of nomad/jobspec/parse*.go
+(Nomad 0.12), including the weakly typed decoding of values.
+"""
+
+import re
+
+from . import hcl
+from .hcl import ParseError
+
+DURATION_RE = re.compile(r"([0-9]*(?:\.[0-9]*)?)(ns|us|µs|μs|ms|s|m|h)")
+DURATION_UNITS = {
+    "ns": 1,
+    "us": 10**3,
+    "µs": 10**3,
+    "μs": 10**3,
+    "ms": 10**6,
+    "s": 10**9,
+    "m": 60 * 10**9,
+    "h": 3600 * 10**9,
+}
+TRUE_STRINGS = {"1", "t", "T", "TRUE", "true", "True"}
+FALSE_STRINGS = {"0", "f", "F", "FALSE", "false", "False"}
+
+
+def is_block(value):
+    return isinstance(value, list) and any(isinstance(v, dict) for v in value)
+
+
+def to_str(value, name):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    elif isinstance(value, float):
+        return str(int(value)) if value.is_integer() else repr(value)
+    elif isinstance(value, (str, int)):
+        return str(value)
+    raise ParseError(f"{name}: expected type 'string', got unconvertible type")
+
+
+def to_int(value, name):
+    if isinstance(value, bool):
+        return int(value)
+    elif isinstance(value, (int, float)):
+        return int(value)
+    elif isinstance(value, str):
+        try:
+            return int(value, 0) if value else 0
+        except ValueError:
+            raise ParseError(f"{name}: cannot parse {value!r} as int")
+    raise ParseError(f"{name}: expected type 'int', got unconvertible type")
+
+
+def to_bool(value, name):
+    if isinstance(value, (bool, int, float)):
+        return bool(value)
+    elif isinstance(value, str):
+        if value in TRUE_STRINGS:
+            return True
+        elif value in FALSE_STRINGS or value == "":
+            return False
+        raise ParseError(f"{name}: cannot parse {value!r} as bool")
+    raise ParseError(f"{name}: expected type 'bool', got unconvertible type")
+
+
+def to_duration(value, name):
+    """Convert to nanoseconds, strings are parsed like Go's `time.ParseDuration`."""
+    if not isinstance(value, str):
+        return to_int(value, name)
+    text = value
+    sign = -1 if text.startswith("-") else 1
+    text = text.lstrip("+-")
+    if text == "0":
+        return 0
+    total, pos = 0, 0
+    while pos < len(text):
+        match = DURATION_RE.match(text, pos)
+        if not match or match.group(1) in ("", "."):
+            raise ParseError(f"{name}: time: invalid duration {value!r}")
+        total += float(match.group(1)) * DURATION_UNITS[match.group(2)]
+        pos = match.end()
+    if not text:
+        raise ParseError(f"{name}: time: invalid duration {value!r}")
+    return sign * int(round(total))
+
+
+def to_str_list(value, name):
+    if not isinstance(value, list):
+        value = [value]
+    return [to_str(v, name) for v in value]
+
+
+def to_any(value, name):
+    return value
+
+
+STR, INT, BOOL, DURATION, STRS, ANY = (
+    to_str,
+    to_int,
+    to_bool,
+    to_duration,
+    to_str_list,
+    to_any,
+)
+
+
+def check_keys(items, valid, context):
+    for item in items:
+        if item.keys and item.keys[0] not in valid:
+            raise ParseError(f"{context}invalid key: {item.keys[0]}")
+
+
+def object_list(item, context):
+    if not isinstance(item.value, hcl.ObjectList):
+        raise ParseError(f"{context}should be an object", item.line)
+    return item.value
+
+
+def decode(items, fields, context):
+    """Decode the `fields` ({hcl key: (field, converter)}) of a block."""
+    result = {}
+    for key, value in hcl.decode_map(items).items():
+        if key not in fields:
+            continue
+        field, convert = fields[key]
+        if is_block(value) and convert is not ANY:
+            raise ParseError(f"{context}{key}: unexpected block")
+        result[field] = convert(value, key)
+    return result
+
+
+def decode_block(items, fields, blocks, context, result=None):
+    check_keys(items, set(fields) | set(blocks), context)
+    result = {} if result is None else result
+    result.update(decode(items, fields, context))
+    return result
+
+
+def merge_maps(items, context, convert=to_str):
+    """Merge repeated blocks like `meta { }` into a single map."""
+    result = {}
+    for item in items.elem():
+        for key, value in hcl.decode_map(object_list(item, context)).items():
+            if is_block(value) and convert is not to_any:
+                raise ParseError(f"{context}{key}: unexpected block")
+            result[key] = convert(value, key)
+    return result
+
+
+def only_one(items, name, context):
+    if len(items) > 1:
+        raise ParseError(f"{context}only one {name!r} block allowed")
+    return items[0]
+
+
+def parse(src):
+    """Parse a HCL job specification into the Nomad API job structure."""
+    root = hcl.parse(src)
+    matches = root.filter("job")
+    if not matches:
+        raise ParseError("'job' stanza not found")
+    try:
+        return parse_job(matches)
+    except ParseError as e:
+        raise ParseError(f"error parsing 'job': {e}")
+
+
+JOB_FIELDS = {
+    "all_at_once": ("AllAtOnce", BOOL),
+    "datacenters": ("Datacenters", STRS),
+    "id": ("ID", STR),
+    "name": ("Name", STR),
+    "namespace": ("Namespace", STR),
+    "priority": ("Priority", INT),
+    "region": ("Region", STR),
+    "type": ("Type", STR),
+    "vault_token": ("VaultToken", STR),
+    "consul_token": ("ConsulToken", STR),
+}
+JOB_BLOCKS = {
+    "constraint",
+    "affinity",
+    "spread",
+    "group",
+    "meta",
+    "migrate",
+    "parameterized",
+    "periodic",
+    "reschedule",
+    "task",
+    "update",
+    "vault",
+}
+
+
+def parse_job(items):
+    if len(items) != 1:
+        raise ParseError("only one 'job' block allowed")
+    items = items.children()
+    if len(items) != 1:
+        raise ParseError("'job' block missing name")
+
+    item = items[0]
+    body = object_list(item, "job: ")
+    # Like `/v1/jobs/parse`, the type is null unless set
+    job = {"ID": item.keys[0], "Name": item.keys[0], "Type": None}
+    decode_block(body, JOB_FIELDS, JOB_BLOCKS, "job: ", job)
+
+    if body.filter("constraint"):
+        job["Constraints"] = parse_constraints(body.filter("constraint"))
+    if body.filter("affinity"):
+        job["Affinities"] = parse_affinities(body.filter("affinity"))
+    if body.filter("spread"):
+        job["Spreads"] = parse_spreads(body.filter("spread"))
+    if body.filter("update"):
+        job["Update"] = parse_update(body.filter("update"))
+    if body.filter("periodic"):
+        job["Periodic"] = parse_periodic(body.filter("periodic"))
+    if body.filter("parameterized"):
+        job["ParameterizedJob"] = parse_parameterized(body.filter("parameterized"))
+    if body.filter("reschedule"):
+        job["Reschedule"] = parse_reschedule(body.filter("reschedule"))
+    if body.filter("migrate"):
+        job["Migrate"] = parse_migrate(body.filter("migrate"))
+    if body.filter("meta"):
+        job["Meta"] = merge_maps(body.filter("meta"), "meta: ")
+
+    # Tasks outside of a group get a group of their own
+    if body.filter("task"):
+        job["TaskGroups"] = [
+            {"Name": task["Name"], "Tasks": [task]}
+            for task in parse_tasks(body.filter("task"))
+        ]
+    if body.filter("group"):
+        job.setdefault("TaskGroups", []).extend(parse_groups(body.filter("group")))
+
+    if body.filter("vault"):
+        vault = parse_vault(body.filter("vault"))
+        for group in job.get("TaskGroups", []):
+            for task in group.get("Tasks", []):
+                task.setdefault("Vault", vault)
+
+    return job
+
+
+GROUP_FIELDS = {
+    "count": ("Count", INT),
+    "shutdown_delay": ("ShutdownDelay", DURATION),
+    "stop_after_client_disconnect": ("StopAfterClientDisconnect", DURATION),
+}
+GROUP_BLOCKS = {
+    "constraint",
+    "affinity",
+    "restart",
+    "meta",
+    "task",
+    "ephemeral_disk",
+    "update",
+    "reschedule",
+    "vault",
+    "migrate",
+    "spread",
+    "network",
+    "service",
+    "volume",
+    "scaling",
+}
+
+
+def parse_groups(items):
+    groups = []
+    seen = set()
+    for item in items.children():
+        name = item.keys[0]
+        if name in seen:
+            raise ParseError(f"group '{name}' defined more than once")
+        seen.add(name)
+        groups.append(parse_group(name, item))
+    return groups
+
+
+def parse_group(name, item):
+    context = f"group: '{name}', "
+    body = object_list(item, context)
+    group = {"Name": name}
+    decode_block(body, GROUP_FIELDS, GROUP_BLOCKS, context, group)
+
+    if body.filter("constraint"):
+        group["Constraints"] = parse_constraints(body.filter("constraint"))
+    if body.filter("affinity"):
+        group["Affinities"] = parse_affinities(body.filter("affinity"))
+    if body.filter("restart"):
+        group["RestartPolicy"] = parse_restart(body.filter("restart"))
+    if body.filter("spread"):
+        group["Spreads"] = parse_spreads(body.filter("spread"))
+    if body.filter("ephemeral_disk"):
+        group["EphemeralDisk"] = parse_ephemeral_disk(body.filter("ephemeral_disk"))
+    if body.filter("update"):
+        group["Update"] = parse_update(body.filter("update"))
+    if body.filter("reschedule"):
+        group["ReschedulePolicy"] = parse_reschedule(body.filter("reschedule"))
+    if body.filter("migrate"):
+        group["Migrate"] = parse_migrate(body.filter("migrate"))
+    if body.filter("network"):
+        group["Networks"] = [parse_network(body.filter("network"))]
+    if body.filter("meta"):
+        group["Meta"] = merge_maps(body.filter("meta"), context)
+    if body.filter("volume"):
+        group["Volumes"] = parse_volumes(body.filter("volume"))
+    if body.filter("task"):
+        group["Tasks"] = parse_tasks(body.filter("task"))
+    if body.filter("vault"):
+        vault = parse_vault(body.filter("vault"))
+        for task in group.get("Tasks", []):
+            task.setdefault("Vault", vault)
+    if body.filter("service"):
+        group["Services"] = parse_services(body.filter("service"))
+    if body.filter("scaling"):
+        group["Scaling"] = parse_scaling(body.filter("scaling"))
+    return group
+
+
+TASK_FIELDS = {
+    "driver": ("Driver", STR),
+    "user": ("User", STR),
+    "kill_timeout": ("KillTimeout", DURATION),
+    "leader": ("Leader", BOOL),
+    "shutdown_delay": ("ShutdownDelay", DURATION),
+    "kill_signal": ("KillSignal", STR),
+    "kind": ("Kind", STR),
+}
+TASK_BLOCKS = {
+    "artifact",
+    "config",
+    "constraint",
+    "affinity",
+    "dispatch_payload",
+    "lifecycle",
+    "env",
+    "logs",
+    "meta",
+    "resources",
+    "restart",
+    "service",
+    "template",
+    "vault",
+    "volume_mount",
+    "csi_plugin",
+}
+
+
+def parse_tasks(items):
+    tasks = []
+    seen = set()
+    for item in items.children():
+        name = item.keys[0]
+        if name in seen:
+            raise ParseError(f"task '{name}' defined more than once")
+        seen.add(name)
+        tasks.append(parse_task(name, object_list(item, f"task '{name}': ")))
+    return tasks
+
+
+def parse_task(name, body, fields=TASK_FIELDS, blocks=TASK_BLOCKS):
+    context = f"'{name}': "
+    task = {"Name": name}
+    decode_block(body, fields, blocks, context, task)
+
+    if body.filter("env"):
+        task["Env"] = merge_maps(body.filter("env"), context)
+    if body.filter("config"):
+        task["Config"] = merge_maps(body.filter("config"), context, to_any)
+    if body.filter("service"):
+        task["Services"] = parse_services(body.filter("service"))
+    if body.filter("constraint"):
+        task["Constraints"] = parse_constraints(body.filter("constraint"))
+    if body.filter("affinity"):
+        task["Affinities"] = parse_affinities(body.filter("affinity"))
+    if body.filter("restart"):
+        task["RestartPolicy"] = parse_restart(body.filter("restart"))
+    if body.filter("meta"):
+        task["Meta"] = merge_maps(body.filter("meta"), context)
+    if body.filter("resources"):
+        task["Resources"] = parse_resources(body.filter("resources"))
+    if body.filter("logs"):
+        task["LogConfig"] = parse_simple(body.filter("logs"), LOG_FIELDS, "logs: ")
+    if body.filter("artifact"):
+        task["Artifacts"] = parse_artifacts(body.filter("artifact"))
+    if body.filter("template"):
+        task["Templates"] = parse_templates(body.filter("template"))
+    if body.filter("vault"):
+        task["Vault"] = parse_vault(body.filter("vault"))
+    if body.filter("dispatch_payload"):
+        task["DispatchPayload"] = parse_simple(
+            body.filter("dispatch_payload"),
+            DISPATCH_PAYLOAD_FIELDS,
+            "dispatch_payload: ",
+        )
+    if body.filter("lifecycle"):
+        task["Lifecycle"] = parse_simple(
+            body.filter("lifecycle"), LIFECYCLE_FIELDS, "lifecycle: "
+        )
+    if body.filter("volume_mount"):
+        task["VolumeMounts"] = [
+            parse_simple(hcl.ObjectList([item]), VOLUME_MOUNT_FIELDS, "volume_mount: ")
+            for item in body.filter("volume_mount")
+        ]
+    if body.filter("csi_plugin"):
+        task["CSIPluginConfig"] = parse_simple(
+            body.filter("csi_plugin"), CSI_PLUGIN_FIELDS, "csi_plugin: "
+        )
+    return task
+
+
+LOG_FIELDS = {"max_files": ("MaxFiles", INT), "max_file_size": ("MaxFileSizeMB", INT)}
+DISPATCH_PAYLOAD_FIELDS = {"file": ("File", STR)}
+LIFECYCLE_FIELDS = {"hook": ("Hook", STR), "sidecar": ("Sidecar", BOOL)}
+VOLUME_MOUNT_FIELDS = {
+    "volume": ("Volume", STR),
+    "destination": ("Destination", STR),
+    "read_only": ("ReadOnly", BOOL),
+    "propagation_mode": ("PropagationMode", STR),
+}
+CSI_PLUGIN_FIELDS = {
+    "id": ("ID", STR),
+    "type": ("Type", STR),
+    "mount_dir": ("MountDir", STR),
+}
+UPDATE_FIELDS = {
+    "stagger": ("Stagger", DURATION),
+    "max_parallel": ("MaxParallel", INT),
+    "health_check": ("HealthCheck", STR),
+    "min_healthy_time": ("MinHealthyTime", DURATION),
+    "healthy_deadline": ("HealthyDeadline", DURATION),
+    "progress_deadline": ("ProgressDeadline", DURATION),
+    "auto_revert": ("AutoRevert", BOOL),
+    "auto_promote": ("AutoPromote", BOOL),
+    "canary": ("Canary", INT),
+}
+RESTART_FIELDS = {
+    "attempts": ("Attempts", INT),
+    "interval": ("Interval", DURATION),
+    "delay": ("Delay", DURATION),
+    "mode": ("Mode", STR),
+}
+RESCHEDULE_FIELDS = {
+    "attempts": ("Attempts", INT),
+    "interval": ("Interval", DURATION),
+    "delay": ("Delay", DURATION),
+    "delay_function": ("DelayFunction", STR),
+    "max_delay": ("MaxDelay", DURATION),
+    "unlimited": ("Unlimited", BOOL),
+}
+MIGRATE_FIELDS = {
+    "max_parallel": ("MaxParallel", INT),
+    "health_check": ("HealthCheck", STR),
+    "min_healthy_time": ("MinHealthyTime", DURATION),
+    "healthy_deadline": ("HealthyDeadline", DURATION),
+}
+EPHEMERAL_DISK_FIELDS = {
+    "sticky": ("Sticky", BOOL),
+    "migrate": ("Migrate", BOOL),
+    "size": ("SizeMB", INT),
+}
+PARAMETERIZED_FIELDS = {
+    "payload": ("Payload", STR),
+    "meta_required": ("MetaRequired", STRS),
+    "meta_optional": ("MetaOptional", STRS),
+}
+VAULT_FIELDS = {
+    "namespace": ("Namespace", STR),
+    "policies": ("Policies", STRS),
+    "env": ("Env", BOOL),
+    "change_mode": ("ChangeMode", STR),
+    "change_signal": ("ChangeSignal", STR),
+}
+
+
+def parse_simple(items, fields, context, result=None):
+    item = only_one(items, context.rstrip(": "), context)
+    return decode_block(object_list(item, context), fields, (), context, result)
+
+
+def parse_update(items):
+    return parse_simple(items, UPDATE_FIELDS, "update: ")
+
+
+def parse_restart(items):
+    return parse_simple(items, RESTART_FIELDS, "restart: ")
+
+
+def parse_reschedule(items):
+    return parse_simple(items, RESCHEDULE_FIELDS, "reschedule: ")
+
+
+def parse_migrate(items):
+    return parse_simple(items, MIGRATE_FIELDS, "migrate: ")
+
+
+def parse_ephemeral_disk(items):
+    return parse_simple(items, EPHEMERAL_DISK_FIELDS, "ephemeral_disk: ")
+
+
+def parse_parameterized(items):
+    return parse_simple(items, PARAMETERIZED_FIELDS, "parameterized: ")
+
+
+def parse_vault(items):
+    vault = {"Env": True, "ChangeMode": "restart"}
+    return parse_simple(items, VAULT_FIELDS, "vault: ", vault)
+
+
+def parse_periodic(items):
+    item = only_one(items, "periodic", "periodic: ")
+    body = object_list(item, "periodic: ")
+    valid = {"enabled", "cron", "prohibit_overlap", "time_zone"}
+    check_keys(body, valid, "periodic: ")
+    m = hcl.decode_map(body)
+
+    # Enabled by default if the periodic block exists
+    periodic = {"Enabled": to_bool(m.get("enabled", True), "enabled")}
+    if "cron" in m:
+        periodic["Spec"] = to_str(m["cron"], "cron")
+        periodic["SpecType"] = "cron"
+    if "prohibit_overlap" in m:
+        periodic["ProhibitOverlap"] = to_bool(m["prohibit_overlap"], "prohibit_overlap")
+    if "time_zone" in m:
+        periodic["TimeZone"] = to_str(m["time_zone"], "time_zone")
+    return periodic
+
+
+CONSTRAINT_KEYS = {
+    "attribute",
+    "distinct_hosts",
+    "distinct_property",
+    "operator",
+    "regexp",
+    "set_contains",
+    "value",
+    "version",
+    "semver",
+}
+AFFINITY_KEYS = {
+    "attribute",
+    "value",
+    "operator",
+    "regexp",
+    "set_contains_all",
+    "set_contains_any",
+    "version",
+    "weight",
+}
+
+
+def parse_operand(m, operands):
+    """Handle the shortcut syntax of constraints (ie `version = ">= 1.0"`)."""
+    for operand in operands:
+        if operand in m:
+            return operand, to_str(m[operand], operand)
+    return None, None
+
+
+def parse_constraints(items):
+    constraints = []
+    for item in items:
+        body = object_list(item, "constraint: ")
+        check_keys(body, CONSTRAINT_KEYS, "constraint: ")
+        m = hcl.decode_map(body)
+
+        constraint = {
+            "LTarget": to_str(m.get("attribute", ""), "attribute"),
+            "RTarget": to_str(m.get("value", ""), "value"),
+            "Operand": to_str(m.get("operator", ""), "operator"),
+        }
+        operand, target = parse_operand(
+            m, ("version", "semver", "regexp", "set_contains")
+        )
+        if operand:
+            constraint["Operand"], constraint["RTarget"] = operand, target
+        if "distinct_hosts" in m:
+            if not to_bool(m["distinct_hosts"], "distinct_hosts"):
+                continue
+            constraint["Operand"] = "distinct_hosts"
+        if "distinct_property" in m:
+            constraint["Operand"] = "distinct_property"
+            constraint["LTarget"] = to_str(m["distinct_property"], "distinct_property")
+        if not constraint["Operand"]:
+            constraint["Operand"] = "="
+        constraints.append(constraint)
+    return constraints
+
+
+def parse_affinities(items):
+    affinities = []
+    for item in items:
+        body = object_list(item, "affinity: ")
+        check_keys(body, AFFINITY_KEYS, "affinity: ")
+        m = hcl.decode_map(body)
+
+        affinity = {
+            "LTarget": to_str(m.get("attribute", ""), "attribute"),
+            "RTarget": to_str(m.get("value", ""), "value"),
+            "Operand": to_str(m.get("operator", ""), "operator"),
+        }
+        if "weight" in m:
+            affinity["Weight"] = to_int(m["weight"], "weight")
+        operand, target = parse_operand(
+            m, ("version", "regexp", "set_contains_any", "set_contains_all")
+        )
+        if operand:
+            affinity["Operand"], affinity["RTarget"] = operand, target
+        if not affinity["Operand"]:
+            affinity["Operand"] = "="
+        affinities.append(affinity)
+    return affinities
+
+
+def parse_spreads(items):
+    spreads = []
+    for item in items:
+        body = object_list(item, "spread: ")
+        fields = {"attribute": ("Attribute", STR), "weight": ("Weight", INT)}
+        spread = decode_block(body, fields, {"target"}, "spread: ")
+        targets = []
+        for target in body.filter("target").children():
+            context = f"target '{target.keys[0]}': "
+            fields = {"percent": ("Percent", INT)}
+            decoded = decode_block(object_list(target, context), fields, (), context)
+            targets.append({"Value": target.keys[0], **decoded})
+        if targets:
+            spread["SpreadTarget"] = targets
+        spreads.append(spread)
+    return spreads
+
+
+NETWORK_FIELDS = {"mode": ("Mode", STR), "mbits": ("MBits", INT)}
+PORT_FIELDS = {
+    "static": ("Value", INT),
+    "to": ("To", INT),
+    "host_network": ("HostNetwork", STR),
+}
+DNS_FIELDS = {
+    "servers": ("Servers", STRS),
+    "searches": ("Searches", STRS),
+    "options": ("Options", STRS),
+}
+PORT_LABEL_RE = re.compile(r"^[a-zA-Z0-9_]+$")
+
+
+def parse_network(items):
+    item = only_one(items, "network", "network: ")
+    body = object_list(item, "network: ")
+    network = decode_block(body, NETWORK_FIELDS, {"port", "dns"}, "network: ")
+
+    labels = set()
+    for port in body.filter("port"):
+        if not port.keys:
+            raise ParseError("ports must be named")
+        label = port.keys[0]
+        if not PORT_LABEL_RE.match(label):
+            raise ParseError(
+                "Invalid port label. Must contain only alphanumeric characters or '_'."
+            )
+        if label.lower() in labels:
+            raise ParseError(f"found a port label collision: {label}")
+        labels.add(label.lower())
+
+        context = f"port '{label}': "
+        fields = decode(object_list(port, context), PORT_FIELDS, context)
+        result = {"Label": label, "Value": 0, "To": 0, "HostNetwork": ""}
+        result.update(fields)
+        key = "ReservedPorts" if result["Value"] > 0 else "DynamicPorts"
+        network.setdefault(key, []).append(result)
+
+    if body.filter("dns"):
+        network["DNS"] = parse_simple(body.filter("dns"), DNS_FIELDS, "dns: ")
+    return network
+
+
+SERVICE_FIELDS = {
+    "name": ("Name", STR),
+    "tags": ("Tags", STRS),
+    "canary_tags": ("CanaryTags", STRS),
+    "enable_tag_override": ("EnableTagOverride", BOOL),
+    "port": ("PortLabel", STR),
+    "address_mode": ("AddressMode", STR),
+    "task": ("TaskName", STR),
+}
+SERVICE_BLOCKS = {"check", "check_restart", "connect", "meta", "canary_meta"}
+CHECK_FIELDS = {
+    "name": ("Name", STR),
+    "type": ("Type", STR),
+    "interval": ("Interval", DURATION),
+    "timeout": ("Timeout", DURATION),
+    "path": ("Path", STR),
+    "protocol": ("Protocol", STR),
+    "port": ("PortLabel", STR),
+    "command": ("Command", STR),
+    "args": ("Args", STRS),
+    "initial_status": ("InitialStatus", STR),
+    "tls_skip_verify": ("TLSSkipVerify", BOOL),
+    "method": ("Method", STR),
+    "address_mode": ("AddressMode", STR),
+    "grpc_service": ("GRPCService", STR),
+    "grpc_use_tls": ("GRPCUseTLS", BOOL),
+    "task": ("TaskName", STR),
+    "success_before_passing": ("SuccessBeforePassing", INT),
+    "failures_before_critical": ("FailuresBeforeCritical", INT),
+    "expose": ("Expose", BOOL),
+}
+CHECK_RESTART_FIELDS = {
+    "limit": ("Limit", INT),
+    "grace": ("Grace", DURATION),
+    "ignore_warnings": ("IgnoreWarnings", BOOL),
+}
+
+
+def parse_services(items):
+    services = []
+    for item in items:
+        context = "service: "
+        body = object_list(item, context)
+        service = decode_block(body, SERVICE_FIELDS, SERVICE_BLOCKS, context)
+
+        if body.filter("check"):
+            service["Checks"] = [
+                parse_check(object_list(check, "check: "))
+                for check in body.filter("check")
+            ]
+        if body.filter("check_restart"):
+            service["CheckRestart"] = parse_simple(
+                body.filter("check_restart")[:1],
+                CHECK_RESTART_FIELDS,
+                "check_restart: ",
+            )
+        if body.filter("connect"):
+            service["Connect"] = parse_connect(body.filter("connect")[0])
+        if body.filter("meta"):
+            service["Meta"] = merge_maps(body.filter("meta"), context)
+        if body.filter("canary_meta"):
+            service["CanaryMeta"] = merge_maps(body.filter("canary_meta"), context)
+        services.append(service)
+    return services
+
+
+def parse_check(body):
+    valid = set(CHECK_FIELDS) | {"header", "check_restart"}
+    check = decode_block(body, CHECK_FIELDS, valid, "check: ")
+
+    # Repeated header blocks are merged into a single map of lists
+    headers = {}
+    for header in body.filter("header").elem():
+        for key, values in hcl.decode_map(object_list(header, "header: ")).items():
+            headers.setdefault(key, []).extend(to_str_list(values, key))
+    if headers:
+        check["Header"] = headers
+
+    if body.filter("check_restart"):
+        check["CheckRestart"] = parse_simple(
+            body.filter("check_restart")[:1], CHECK_RESTART_FIELDS, "check_restart: "
+        )
+    return check
+
+
+SIDECAR_TASK_FIELDS = {
+    key: TASK_FIELDS[key]
+    for key in ("driver", "user", "kill_timeout", "shutdown_delay", "kill_signal")
+}
+SIDECAR_TASK_BLOCKS = {"config", "env", "logs", "meta", "resources"}
+UPSTREAM_FIELDS = {
+    "destination_name": ("DestinationName", STR),
+    "local_bind_port": ("LocalBindPort", INT),
+    "datacenter": ("Datacenter", STR),
+}
+EXPOSE_PATH_FIELDS = {
+    "path": ("Path", STR),
+    "protocol": ("Protocol", STR),
+    "local_path_port": ("LocalPathPort", INT),
+    "listener_port": ("ListenerPort", INT),
+}
+
+
+def parse_connect(item):
+    context = "connect: "
+    body = object_list(item, context)
+    if body.filter("gateway"):
+        raise ParseError(
+            f"{context}gateways are not supported by the local parser, "
+            "use --parser=remote instead"
+        )
+    blocks = {"sidecar_service", "sidecar_task"}
+    connect = decode_block(body, {"native": ("Native", BOOL)}, blocks, context)
+
+    if body.filter("sidecar_service"):
+        sidecar = only_one(body.filter("sidecar_service"), "sidecar_service", context)
+        connect["SidecarService"] = parse_sidecar_service(sidecar)
+    if body.filter("sidecar_task"):
+        sidecar = only_one(body.filter("sidecar_task"), "sidecar_task", context)
+        task = parse_task(
+            "",
+            object_list(sidecar, "sidecar_task: "),
+            SIDECAR_TASK_FIELDS,
+            SIDECAR_TASK_BLOCKS,
+        )
+        del task["Name"]
+        connect["SidecarTask"] = task
+    return connect
+
+
+def parse_sidecar_service(item):
+    context = "sidecar_service: "
+    body = object_list(item, context)
+    fields = {"port": ("Port", STR), "tags": ("Tags", STRS)}
+    sidecar = decode_block(body, fields, {"proxy"}, context)
+
+    if body.filter("proxy"):
+        proxy = only_one(body.filter("proxy"), "proxy", context)
+        sidecar["Proxy"] = parse_proxy(object_list(proxy, "proxy: "))
+    return sidecar
+
+
+def parse_proxy(body):
+    context = "proxy: "
+    fields = {
+        "local_service_address": ("LocalServiceAddress", STR),
+        "local_service_port": ("LocalServicePort", INT),
+    }
+    proxy = decode_block(body, fields, {"upstreams", "expose", "config"}, context)
+
+    if body.filter("upstreams"):
+        proxy["Upstreams"] = [
+            parse_simple(hcl.ObjectList([item]), UPSTREAM_FIELDS, "upstreams: ")
+            for item in body.filter("upstreams")
+        ]
+    if body.filter("expose"):
+        expose = only_one(body.filter("expose"), "expose", context)
+        expose = object_list(expose, "expose: ")
+        check_keys(expose, {"path"}, "expose: ")
+        proxy["ExposeConfig"] = {
+            "Path": [
+                parse_simple(hcl.ObjectList([item]), EXPOSE_PATH_FIELDS, "path: ")
+                for item in expose.filter("path")
+            ]
+        }
+    if body.filter("config"):
+        proxy["Config"] = merge_maps(body.filter("config"), context, to_any)
+    return proxy
+
+
+RESOURCES_FIELDS = {
+    "cpu": ("CPU", INT),
+    "memory": ("MemoryMB", INT),
+    "disk": ("DiskMB", INT),
+    "iops": ("IOPS", INT),
+}
+
+
+def parse_resources(items):
+    item = only_one(items, "resource", "resources: ")
+    body = object_list(item, "resources: ")
+    resources = decode_block(
+        body, RESOURCES_FIELDS, {"network", "device"}, "resources: "
+    )
+
+    if body.filter("network"):
+        resources["Networks"] = [parse_network(body.filter("network"))]
+
+    devices = []
+    for index, device in enumerate(body.filter("device")):
+        context = f"resources, device[{index}]->"
+        if not device.keys:
+            raise ParseError(f"{context}missing device name")
+        device_body = object_list(device, context)
+        fields = {"count": ("Count", INT)}
+        result = {"Name": device.keys[0]}
+        decode_block(device_body, fields, {"constraint", "affinity"}, context, result)
+        if device_body.filter("constraint"):
+            result["Constraints"] = parse_constraints(device_body.filter("constraint"))
+        if device_body.filter("affinity"):
+            result["Affinities"] = parse_affinities(device_body.filter("affinity"))
+        devices.append(result)
+    if devices:
+        resources["Devices"] = devices
+    return resources
+
+
+ARTIFACT_FIELDS = {
+    "source": ("GetterSource", STR),
+    "mode": ("GetterMode", STR),
+    "destination": ("RelativeDest", STR),
+}
+TEMPLATE_FIELDS = {
+    "source": ("SourcePath", STR),
+    "destination": ("DestPath", STR),
+    "data": ("EmbeddedTmpl", STR),
+    "change_mode": ("ChangeMode", STR),
+    "change_signal": ("ChangeSignal", STR),
+    "splay": ("Splay", DURATION),
+    "perms": ("Perms", STR),
+    "left_delimiter": ("LeftDelim", STR),
+    "right_delimiter": ("RightDelim", STR),
+    "env": ("Envvars", BOOL),
+    "vault_grace": ("VaultGrace", DURATION),
+}
+
+
+def parse_artifacts(items):
+    artifacts = []
+    for item in items:
+        context = "artifact: "
+        body = object_list(item, context)
+        artifact = decode_block(body, ARTIFACT_FIELDS, {"options", "headers"}, context)
+        artifact["GetterOptions"] = merge_maps(body.filter("options"), context)
+        if body.filter("headers"):
+            artifact["GetterHeaders"] = merge_maps(body.filter("headers"), context)
+        artifacts.append(artifact)
+    return artifacts
+
+
+def parse_templates(items):
+    templates = []
+    for item in items:
+        template = {"ChangeMode": "restart", "Splay": 5 * 10**9, "Perms": "0644"}
+        body = object_list(item, "template: ")
+        decode_block(body, TEMPLATE_FIELDS, (), "template: ", template)
+        templates.append(template)
+    return templates
+
+
+def parse_volumes(items):
+    volumes = {}
+    for item in items.children():
+        name = item.keys[0]
+        context = f"volume '{name}': "
+        fields = {
+            "type": ("Type", STR),
+            "source": ("Source", STR),
+            "read_only": ("ReadOnly", BOOL),
+        }
+        volume = {"Name": name}
+        volumes[name] = decode_block(
+            object_list(item, context), fields, (), context, volume
+        )
+    return volumes
+
+
+def parse_scaling(items):
+    item = only_one(items, "scaling", "scaling: ")
+    body = object_list(item, "scaling: ")
+    fields = {"min": ("Min", INT), "max": ("Max", INT), "enabled": ("Enabled", BOOL)}
+    scaling = decode_block(body, fields, {"policy"}, "scaling: ")
+    if body.filter("policy"):
+        if len(body.filter("policy").elem()) > 1:
+            raise ParseError("scaling: only one 'policy' block allowed")
+        scaling["Policy"] = merge_maps(body.filter("policy"), "policy: ", to_any)
+    return scaling
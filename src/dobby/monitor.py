@@ -0,0 +1,206 @@
+import asyncio
+import json
+
+import click
+import httpx
+
+from . import utils
+
+EVALUATION = "Evaluation"
+DEPLOYMENT = "Deployment"
+
+PATHS = {EVALUATION: "/v1/evaluation/{}", DEPLOYMENT: "/v1/deployment/{}"}
+
+# Nomad sends a heartbeat every 10 seconds on an idle stream
+STREAM_READ_TIMEOUT = 30
+
+
+class Watch:
+    """Follow the evaluation chain (and optionally the deployment) of a job.
+
+    A watch only tracks state and prints progress, fetching the updates is
+    left to `poll` (blocking queries) or an `EventMonitor` (event stream).
+    """
+
+    def __init__(
+        self,
+        job_id=None,
+        eval_id=None,
+        deployment_id=None,
+        follow_deployment=True,
+        echo=click.echo,
+    ):
+        self.job_id = job_id
+        self.follow_deployment = follow_deployment
+        self.echo = echo
+        self.done = False
+        self.success = None
+        self.deployment_id = None
+        self.synced = None
+        if eval_id:
+            self._follow(EVALUATION, eval_id)
+        else:
+            self._follow(DEPLOYMENT, deployment_id)
+
+    @property
+    def path(self):
+        return PATHS[self.kind].format(self.key)
+
+    def _follow(self, kind, key):
+        self.kind, self.key = kind, key
+        self.echo(f"- Monitoring {kind.lower()} {repr(key)}.")
+
+    def _finish(self, success):
+        self.done = True
+        self.success = success
+
+    def update(self, kind, obj):
+        """Process the current state of an evaluation or deployment."""
+        if self.done or kind != self.kind or obj["ID"] != self.key:
+            return
+        if kind == EVALUATION:
+            self._evaluation(obj)
+        else:
+            self._deployment(obj)
+
+    def _evaluation(self, eval):
+        status = eval["Status"]
+        if status in ("failed", "cancelled"):
+            self.echo("\n" f"Evaluation failed: {eval['StatusDescription']}")
+            self._finish(False)
+        elif status == "complete":
+            self.echo(f"- Evaluation {repr(self.key)} completed successfully.")
+            if eval.get("NextEval", None):
+                self._follow(EVALUATION, eval["NextEval"])
+            else:
+                self.deployment_id = eval.get("DeploymentID", None)
+                if self.deployment_id and self.follow_deployment:
+                    self._follow(DEPLOYMENT, self.deployment_id)
+                else:
+                    self._finish(True)
+
+    def _deployment(self, deployment):
+        status = deployment["Status"]
+        if status in ("failed", "cancelled"):
+            self.echo("\n" f"Deployment failed: {deployment['StatusDescription']}")
+            self._finish(False)
+        elif status == "successful":
+            self.echo(f"- Deployment {repr(self.key)} completed successfully.")
+            self._finish(True)
+
+    async def poll(self, config):
+        """Follow the watch to the end via blocking queries."""
+        query = None
+        while not self.done:
+            if query is None or query.path != self.path:
+                query = utils.BlockingQuery(config, self.path)
+            with config.timings.span(f"monitor {self.kind.lower()}"):
+                self.update(self.kind, await query.get())
+        return self.success
+
+
+class StreamUnavailable(Exception):
+    pass
+
+
+class EventMonitor:
+    """Follow many watches over a single connection to `/v1/event/stream`.
+
+    Events are filtered by the IDs of the watched jobs and dispatched to the
+    watch currently waiting on the evaluation or deployment in question. If
+    the event stream is not available (old Nomad versions, disabled event
+    broker, missing ACL permissions) or breaks down, the remaining watches
+    are followed via blocking queries instead.
+    """
+
+    topics = (EVALUATION, DEPLOYMENT)
+
+    def __init__(self, config):
+        self.config = config
+        self.watches = []
+
+    def watch(self, job_id, eval_id, follow_deployment=True, echo=click.echo):
+        watch = Watch(job_id, eval_id, None, follow_deployment, echo)
+        self.watches.append(watch)
+        return watch
+
+    @property
+    def pending(self):
+        return [w for w in self.watches if not w.done]
+
+    async def run(self):
+        try:
+            with self.config.timings.span("monitor events"):
+                await self._stream()
+        except (StreamUnavailable, httpx.TransportError):
+            await asyncio.gather(*(w.poll(self.config) for w in self.pending))
+        return all(w.success for w in self.watches)
+
+    async def _sync(self, watch):
+        """Fetch the state of the resources a watch has not seen yet.
+
+        Returns the Nomad index of the last fetched resource.
+        """
+        index = 0
+        retry = self.config.retry_policy.budget()
+        while not watch.done and watch.synced != (watch.kind, watch.key):
+            watch.synced = (watch.kind, watch.key)
+            response = await retry.call(
+                lambda path=watch.path: self.config.client.get(path)
+            )
+            if response.status_code != 200:
+                raise utils.ApiError(response)
+            index = int(response.headers.get("X-Nomad-Index", 0))
+            watch.update(watch.kind, response.json())
+        return index
+
+    async def _stream(self):
+        index = None
+        for watch in self.watches:
+            watch.synced = None
+            synced_index = await self._sync(watch)
+            index = synced_index if index is None else min(index, synced_index)
+
+        timeout = self.config.client.timeout
+        timeout = httpx.Timeout(
+            connect=timeout.connect,
+            read=STREAM_READ_TIMEOUT,
+            write=timeout.write,
+            pool=timeout.pool,
+        )
+        while self.pending:
+            received = False
+            params = [("index", index or 0)]
+            for job_id in sorted({w.job_id for w in self.pending}):
+                params += [("topic", f"{topic}:{job_id}") for topic in self.topics]
+
+            async with self.config.client.stream(
+                "GET", "/v1/event/stream", params=params, timeout=timeout
+            ) as response:
+                if response.status_code != 200:
+                    raise StreamUnavailable(response.status_code)
+                async for line in response.aiter_lines():
+                    line = line.strip()
+                    if not line:
+                        continue
+                    received = True
+                    frame = json.loads(line)
+                    if not frame:  # heartbeat
+                        continue
+                    index = frame["Index"]
+                    for event in frame["Events"]:
+                        await self._dispatch(event)
+                    if not self.pending:
+                        break
+            if not received:
+                raise StreamUnavailable("Event stream closed without any events.")
+
+    async def _dispatch(self, event):
+        kind = event["Topic"]
+        if kind not in PATHS:
+            return
+        obj = event["Payload"][kind]
+        for watch in self.pending:
+            watch.update(kind, obj)
+            # The watch might have moved on to a new evaluation or deployment
+            await self._sync(watch)
@@ -0,0 +1,72 @@
+"""
+Saved plans, written by `dobby plan --out` and applied by `dobby deploy --plan`.
+
+A plan file holds the parsed job together with the `JobModifyIndex` it was
+planned against, so applying it needs neither rendering, parsing nor another
+plan request. Nomad refuses the submission if the job changed in the meantime.
+
+The modify index is only meaningful for the cluster, region and namespace the
+job was planned against, so the plan is only applied to that target.
+"""
+
+import json
+from pathlib import Path
+
+from . import cache, utils
+
+VERSION = 2
+FIELDS = (
+    "Job",
+    "Address",
+    "Region",
+    "Namespace",
+    "JobModifyIndex",
+    "DiffType",
+    "FailedTGAllocs",
+)
+
+
+class PlanFileError(Exception):
+    pass
+
+
+def dump(path, job, plan, config):
+    diff = plan.get("Diff") or {}
+    data = utils.job_body(
+        job,
+        Version=VERSION,
+        Address=config.address,
+        Region=config.target.region,
+        Namespace=config.target.namespace,
+        JobModifyIndex=plan["JobModifyIndex"],
+        DiffType=diff.get("Type"),
+        FailedTGAllocs=plan["FailedTGAllocs"],
+    )
+    cache.write_atomic(Path(path), data)
+
+
+def load(path):
+    try:
+        artifact = json.loads(Path(path).read_bytes())
+    except (OSError, ValueError) as e:
+        raise PlanFileError(f"Could not read plan file {str(path)!r}: {e}")
+    if not isinstance(artifact, dict) or artifact.get("Version") != VERSION:
+        raise PlanFileError(f"Unsupported plan file {str(path)!r}.")
+    missing = [field for field in FIELDS if field not in artifact]
+    if missing:
+        raise PlanFileError(
+            f"Invalid plan file {str(path)!r}, missing: {', '.join(missing)}."
+        )
+    if not isinstance(artifact["Job"], dict) or "ID" not in artifact["Job"]:
+        raise PlanFileError(f"Invalid plan file {str(path)!r}, the job has no ID.")
+    return artifact
+
+
+def target_mismatch(artifact, config):
+    """Describe the target of the plan if it differs from that of `config`."""
+    planned = (artifact["Address"], artifact["Region"], artifact["Namespace"])
+    target = (config.address, config.target.region, config.target.namespace)
+    if planned == target:
+        return None
+    label = "/".join(filter(None, planned[1:])) or "default"
+    return f"{planned[0]} ({label})"
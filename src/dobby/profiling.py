@@ -0,0 +1,148 @@
+"""
+Profiling of template rendering (see `--profile`).
+
+While rendering, a profile function follows the Python frames of compiled
+templates: time is attributed to the template whose code is running (helpers
+called from a template, like filters, count towards it). Macro calls are
+timed including everything they call, and lookups of variables through the
+template context are counted.
+
+Optionally the rendering is repeated under `cProfile` and the statistics of
+all rendered templates are written to a pstats file.
+"""
+
+import cProfile
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from jinja2.runtime import Macro
+
+from .templates import NormalizedLookupContext
+
+MACRO_CODE = Macro._invoke.__code__
+LOOKUP_CODES = frozenset(
+    {
+        NormalizedLookupContext.resolve.__code__,
+        NormalizedLookupContext.resolve_or_missing.__code__,
+    }
+)
+
+
+class RenderProfile:
+    """The profile of rendering a single template (in a single thread)."""
+
+    def __init__(self, environment):
+        self.environment = environment
+        self.templates = defaultdict(float)
+        self.macros = defaultdict(lambda: [0, 0.0])
+        self.lookups = 0
+        self._names = {}
+        self._stack = []
+        self._macro_starts = {}
+        self._last = None
+
+    def _template_name(self, code, frame):
+        try:
+            return self._names[code]
+        except KeyError:
+            pass
+        globals = frame.f_globals
+        name = None
+        if globals.get("environment") is self.environment:
+            name = globals.get("name")
+        self._names[code] = name
+        return name
+
+    def _switch(self, now):
+        if self._stack:
+            self.templates[self._stack[-1]] += now - self._last
+        self._last = now
+
+    def __call__(self, frame, event, arg):
+        if event == "call":
+            code = frame.f_code
+            if code in LOOKUP_CODES:
+                self.lookups += 1
+            elif code is MACRO_CODE:
+                self._macro_starts[frame] = time.perf_counter()
+            else:
+                name = self._template_name(code, frame)
+                if name is not None:
+                    self._switch(time.perf_counter())
+                    self._stack.append(name)
+        elif event == "return":
+            code = frame.f_code
+            if code is MACRO_CODE:
+                start = self._macro_starts.pop(frame, None)
+                if start is not None:
+                    macro = frame.f_locals["self"]
+                    key = (macro._func.__globals__.get("name"), macro.name)
+                    stats = self.macros[key]
+                    stats[0] += 1
+                    stats[1] += time.perf_counter() - start
+            elif self._template_name(code, frame) is not None and self._stack:
+                self._switch(time.perf_counter())
+                self._stack.pop()
+
+
+class TemplateProfiler:
+    """Collect the profiles of all templates rendered (from any thread).
+
+    If `pstats_path` is set, every template is rendered a second time under
+    `cProfile` (so both profilers do not get into each others way).
+    """
+
+    def __init__(self, pstats_path=None):
+        self.pstats_path = pstats_path
+        self.templates = defaultdict(float)
+        self.macros = defaultdict(lambda: [0, 0.0])
+        self.lookups = 0
+        self.renders = 0
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def render(self, template, variables):
+        """Render `template` with `variables` while profiling it."""
+        profile = RenderProfile(template.environment)
+        previous = sys.getprofile()
+        sys.setprofile(profile)
+        try:
+            result = template.render(variables)
+        finally:
+            sys.setprofile(previous)
+
+        profiler = None
+        if self.pstats_path:
+            profiler = cProfile.Profile()
+            profiler.runcall(template.render, variables)
+
+        with self._lock:
+            self.renders += 1
+            self.lookups += profile.lookups
+            for name, seconds in profile.templates.items():
+                self.templates[name] += seconds
+            for key, (calls, seconds) in profile.macros.items():
+                self.macros[key][0] += calls
+                self.macros[key][1] += seconds
+            if profiler is not None:
+                self.profiles.append(profiler)
+        return result
+
+    def report(self):
+        lines = [f"Template profile ({self.renders} render(s)):", "", "Templates:"]
+        for name, seconds in sorted(self.templates.items(), key=lambda i: -i[1]):
+            lines.append(f"  {seconds:8.3f}s  {name}")
+        if self.macros:
+            lines += ["", "Macros (calls, total time):"]
+            by_time = sorted(self.macros.items(), key=lambda i: -i[1][1])
+            for (template, macro), (calls, seconds) in by_time:
+                lines.append(f"  {calls:6d}  {seconds:8.3f}s  {template}:{macro}")
+        lines += ["", f"Variable lookups: {self.lookups}"]
+        return "\n".join(lines)
+
+    def dump_stats(self):
+        if self.pstats_path and self.profiles:
+            pstats.Stats(*self.profiles).dump_stats(str(self.pstats_path))
@@ -0,0 +1,59 @@
+"""Execution layer for the asyncio based command implementations."""
+
+import asyncio
+import contextlib
+
+import click
+
+# The event loop of `dobby serve` (running in another thread) if set, it is
+# shared by all commands so their HTTP clients can be reused
+_shared_loop = None
+
+
+def share_loop(loop):
+    global _shared_loop
+    _shared_loop = loop
+
+
+def run(coroutine):
+    """Run `coroutine` to completion on a fresh (or the shared) event loop."""
+    if _shared_loop is not None:
+        context = click.get_current_context(silent=True)
+        future = asyncio.run_coroutine_threadsafe(
+            run_shared(coroutine, context), _shared_loop
+        )
+        result, exit = future.result()
+        if exit is not None:
+            raise exit
+        return result
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        try:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+
+async def run_shared(coroutine, context):
+    """Return the result of `coroutine` and the `SystemExit` it raised.
+
+    A `SystemExit` must not escape a task as it would stop the shared event
+    loop. The click `context` is pushed as it is local to the calling thread.
+    """
+    scope = context.scope(cleanup=False) if context else contextlib.nullcontext()
+    try:
+        with scope:
+            return await coroutine, None
+    except SystemExit as e:
+        return None, e
+
+
+async def run_sync(f, *args):
+    """Run a blocking (CPU bound) function without blocking the event loop."""
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, f, *args)
@@ -1,17 +1,61 @@
 import functools
+import io
 import json
 import os
 import pathlib
 import re
+import sys
+import threading
 
+import jinja2
 import yaml
 from dotenv.main import DotEnv
-from jinja2 import Environment, FileSystemLoader, StrictUndefined
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    StrictUndefined,
+    meta,
+)
 from jinja2.runtime import Context
 
+from . import cache
+
+# Prefer libyaml (if PyYAML was built with it) and orjson (if installed)
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 NORMALIZATION_RE = re.compile("[^0-9a-z]")
 
+DELIMITERS = {
+    "block_start_string": "[%",
+    "block_end_string": "%]",
+    "variable_start_string": "[[",
+    "variable_end_string": "]]",
+    "comment_start_string": "[#",
+    "comment_end_string": "#]",
+}
+
 
+@functools.lru_cache(maxsize=None)
+def snapshot_fingerprint():
+    """Snapshots of variable files are invalidated when any of these change."""
+    try:
+        from importlib.metadata import version
+    except ModuleNotFoundError:
+        from importlib_metadata import version
+
+    return (version("dobby"), sys.version, yaml.__version__)
+
+
+@functools.lru_cache(maxsize=4096)
 def normalize_key(key):
     return NORMALIZATION_RE.sub("", key.lower())
 
@@ -42,24 +86,73 @@ def load_var_file(f):
     if ext == ".env":
         data = os_env_to_dict(DotEnv(f).dict())
     else:
-        with open(f) as fh:
+        with open(f, "rb") as fh:
             if ext == ".json":
-                data = json.load(fh)
+                data = load_json(fh.read())
             else:
-                data = yaml.safe_load(fh)
+                data = yaml.load(fh, Loader=SafeLoader)
         data = normalize_object(data)
     return data
 
 
-def load_vars(var_files, os_environ):
-    vars = [load_var_file(f) for f in var_files]
-    os_environ = {
-        k: v
-        for k, v in os_environ.items()
-        if k.split("_")[0] not in ("NOMAD", "CONSUL")
-    }
-    vars.append(os_env_to_dict(os_environ))
-    return functools.reduce(merge_dict, vars)
+def load_json(data):
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # The json module is more lenient (ie NaN, huge integers)
+            pass
+    return json.loads(data)
+
+
+def merge_var_files(var_files):
+    return functools.reduce(merge_dict, map(load_var_file, var_files), {})
+
+
+def load_file_vars(var_files):
+    """Load and merge `var_files`, reusing a snapshot if they did not change."""
+    var_files = [pathlib.Path(f).resolve() for f in var_files]
+    vars_cache = cache.VarsCache(snapshot_fingerprint())
+    data = vars_cache.get(var_files)
+    if data is None:
+        data = merge_var_files(var_files)
+        vars_cache.set(var_files, data)
+    return data
+
+
+def compile_vars(var_files):
+    """Write the snapshot for `var_files` and return its path (None on failure)."""
+    var_files = [pathlib.Path(f).resolve() for f in var_files]
+    vars_cache = cache.VarsCache(snapshot_fingerprint())
+    return vars_cache.set(var_files, merge_var_files(var_files))
+
+
+def env_index(os_environ):
+    """Group the environment variables by the variable they (partially) define."""
+    index = {}
+    for key in os_environ:
+        first = key.split("_")[0]
+        if first not in ("NOMAD", "CONSUL"):
+            index.setdefault(normalize_key(first), []).append(key)
+    return index
+
+
+def load_vars(var_files, os_environ, names=None):
+    """Merge the variable files and the environment.
+
+    If `names` is given only those top-level variables are built, which saves
+    converting (potentially thousands of) unused environment variables.
+    """
+    file_vars = load_file_vars(var_files)
+    index = env_index(os_environ)
+    if names is not None:
+        file_vars = {k: v for k, v in file_vars.items() if k in names}
+        index = {k: v for k, v in index.items() if k in names}
+
+    env_vars = {}
+    for env_keys in index.values():
+        env_vars.update(os_env_to_dict({k: os_environ[k] for k in env_keys}))
+    return merge_dict(file_vars, env_vars)
 
 
 def merge_dict(d1, d2):
@@ -73,46 +166,205 @@ def merge_dict(d1, d2):
 
 
 def normalized_lookup_dict(d):
-    return NormalizedLookupDict(
-        {
-            k: normalized_lookup_dict(v) if isinstance(v, dict) else v
-            for k, v in d.items()
-        }
-    )
+    return NormalizedLookupDict(d)
+
+
+MISSING = object()
 
 
 class NormalizedLookupDict(dict):
+    """A dict normalizing looked up keys.
+
+    Nested dictionaries are converted on first access instead of upfront.
+    """
+
     def __init__(self, d):
         super().__init__(d)
+        # Variables are stored with normalized keys, in that case keys which
+        # are found as is do not need to be normalized on lookup
+        self._normalized = all(
+            type(k) is str and normalize_key(k) == k for k in self.keys()
+        )
+
+    def _wrap(self, key, value):
+        if type(value) is dict:
+            value = NormalizedLookupDict(value)
+            super().__setitem__(key, value)
+        return value
 
     def __getitem__(self, key):
-        return super().__getitem__(normalize_key(key))
+        value = super().get(key, MISSING) if self._normalized else MISSING
+        if value is MISSING:
+            key = normalize_key(key)
+            value = super().__getitem__(key)
+        return self._wrap(key, value)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self._wrap(key, super().__getitem__(key))
+        return default
+
+    def items(self):
+        return [(k, self._wrap(k, v)) for k, v in super().items()]
+
+    def values(self):
+        return [v for _, v in self.items()]
 
 
 class NormalizedLookupContext(Context):
     def resolve(self, key):
         return super().resolve(normalize_key(key))
 
+    def resolve_or_missing(self, key):
+        return super().resolve_or_missing(normalize_key(key))
 
-def render(hcl_file, var_files, os_environ=os.environ):
+
+DICT_ATTRIBUTES = frozenset(dir(NormalizedLookupDict))
+
+
+class NormalizedLookupEnvironment(Environment):
+    # NormalizedLookupContext is needed because jinja will reconstruct the context :/
+    context_class = NormalizedLookupContext
+
+    def getattr(self, obj, attribute):
+        # Look up variables directly instead of trying (and failing) to get an
+        # attribute of the same name first
+        if type(obj) is NormalizedLookupDict and attribute not in DICT_ATTRIBUTES:
+            try:
+                return obj[attribute]
+            except (TypeError, LookupError, AttributeError):
+                return self.undefined(obj=obj, name=attribute)
+        return super().getattr(obj, attribute)
+
+
+class BytecodeCache(FileSystemBytecodeCache):
+    """On-disk cache for compiled templates.
+
+    Jinja validates entries against the checksum of the template source, the
+    key additionally covers the delimiters and the Jinja version so changing
+    either never picks up incompatible bytecode. Loading an entry bumps its
+    modification time, the least recently used entries of the directory are
+    evicted once it exceeds `cache.TEMPLATES_MAX_SIZE`.
+    """
+
+    def __init__(self, directory):
+        super().__init__(str(directory), "%s.cache")
+        self.path = pathlib.Path(directory)
+
+    def get_cache_key(self, name, filename=None):
+        return cache.digest(
+            jinja2.__version__, *DELIMITERS.values(), name, filename or ""
+        )
+
+    def load_bytecode(self, bucket):
+        try:
+            super().load_bytecode(bucket)
+            if bucket.code is not None:
+                os.utime(self._get_cache_filename(bucket))
+        except (OSError, EOFError, ValueError):
+            bucket.reset()
+
+    def dump_bytecode(self, bucket):
+        out = io.BytesIO()
+        bucket.write_bytecode(out)
+        try:
+            cache.write_atomic(
+                pathlib.Path(self._get_cache_filename(bucket)), out.getvalue()
+            )
+            cache.evict(self.path.glob("*"), cache.TEMPLATES_MAX_SIZE)
+        except OSError:
+            pass
+
+
+_environments = {}
+_environments_lock = threading.Lock()
+
+
+def get_environment(search_path):
+    """Return the (shared) environment for templates within `search_path`.
+
+    Environments are reused, so templates are only compiled once per process
+    (and reloaded when their source changes).
+    """
+    bytecode_dir = cache.cache_dir() / "templates"
+    key = (str(pathlib.Path(search_path).resolve()), str(bytecode_dir))
+    with _environments_lock:
+        env = _environments.get(key)
+        if env is None:
+            env = NormalizedLookupEnvironment(
+                loader=FileSystemLoader(search_path),
+                autoescape=False,
+                undefined=StrictUndefined,
+                bytecode_cache=BytecodeCache(bytecode_dir),
+                **DELIMITERS,
+            )
+            _environments[key] = env
+    return env
+
+
+def analyze_template(env, source):
+    """Return the variables and templates referenced by `source`.
+
+    The result is cached next to the compiled templates (and evicted with
+    them, see `BytecodeCache`).
+    """
+    key = cache.digest(jinja2.__version__, *DELIMITERS.values(), source)
+    entry = cache.cache_dir() / "templates" / f"{key}.vars"
+    try:
+        info = json.loads(entry.read_bytes())
+        os.utime(entry)
+        return info
+    except (OSError, ValueError):
+        pass
+
+    ast = env.parse(source)
+    info = {
+        "variables": sorted(meta.find_undeclared_variables(ast)),
+        "templates": list(meta.find_referenced_templates(ast)),
+    }
+    try:
+        cache.write_atomic(entry, json.dumps(info).encode())
+        cache.evict(entry.parent.glob("*"), cache.TEMPLATES_MAX_SIZE)
+    except OSError:
+        pass
+    return info
+
+
+def template_variables(env, template_name):
+    """Return the (normalized) names of all variables a template might use.
+
+    Included and imported templates are followed, None is returned if the
+    names of those are only known at render time.
+    """
+    names, seen, pending = set(), set(), [template_name]
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        source, _, _ = env.loader.get_source(env, name)
+        info = analyze_template(env, source)
+        if None in info["templates"]:
+            return None
+        names.update(normalize_key(n) for n in info["variables"])
+        pending.extend(info["templates"])
+    return names
+
+
+def render(hcl_file, var_files, os_environ=os.environ, profiler=None):
     p = pathlib.Path(hcl_file)
     template_name = p.name
     search_path = p.parent
 
-    env = Environment(
-        loader=FileSystemLoader(search_path),
-        autoescape=False,
-        block_start_string="[%",
-        block_end_string="%]",
-        variable_start_string="[[",
-        variable_end_string="]]",
-        comment_start_string="[#",
-        comment_end_string="#]",
-        undefined=StrictUndefined,
-    )
-    # NormalizedLookupContext is needed because jinja will reconstruct the context :/
-    env.context_class = NormalizedLookupContext
+    env = get_environment(search_path)
     template = env.get_template(template_name)
+    names = template_variables(env, template_name)
+    variables = load_vars(var_files, os_environ, names)
     # Call `normalized_lookup_dict` so all lookups are normalized to the correct form
-    variables = normalized_lookup_dict(load_vars(var_files, os_environ))
+    variables = {
+        k: normalized_lookup_dict(v) if isinstance(v, dict) else v
+        for k, v in variables.items()
+    }
+    if profiler is not None:
+        return profiler.render(template, variables)
     return template.render(variables)
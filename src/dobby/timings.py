@@ -0,0 +1,137 @@
+"""
+Lightweight instrumentation of the phases of a command (see `--timings`).
+
+Phases are wrapped in named spans which aggregate the wall time, the number of
+times they were entered as well as the requests, bytes and retries recorded
+while they are active. Spans nest: a request made while planning a job counts
+towards the `plan` span and towards its own `http ...` span.
+
+When disabled `NO_TIMINGS` is used, which does not record anything.
+"""
+
+import contextlib
+import contextvars
+import json
+import time
+
+from . import cache, utils
+
+# The spans active in the current task (empty unless timings are enabled)
+_active = contextvars.ContextVar("active_spans", default=())
+
+COUNTERS = ("requests", "sent", "received", "retries")
+
+# Resources whose path segment after the resource name is an ID
+ID_RESOURCES = frozenset({"job", "evaluation", "deployment", "allocation", "node"})
+
+
+class SpanStats:
+    __slots__ = ("name", "count", "seconds") + COUNTERS
+
+    def __init__(self, name):
+        self.name = name
+        self.count = self.seconds = 0
+        for counter in COUNTERS:
+            setattr(self, counter, 0)
+
+    def as_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class Timings:
+    def __init__(self):
+        self.spans = {}
+
+    @contextlib.contextmanager
+    def span(self, name):
+        stats = self.spans.get(name)
+        if stats is None:
+            stats = self.spans[name] = SpanStats(name)
+        token = _active.set(_active.get() + (stats,))
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.seconds += time.perf_counter() - start
+            stats.count += 1
+            _active.reset(token)
+
+    def table(self):
+        header = ("Span", "Count", "Time", "Requests", "Sent", "Received", "Retries")
+        rows = [header]
+        for stats in self.spans.values():
+            rows.append(
+                (
+                    stats.name,
+                    str(stats.count),
+                    f"{stats.seconds:.3f}s",
+                    str(stats.requests),
+                    utils.format_size(stats.sent),
+                    utils.format_size(stats.received),
+                    str(stats.retries),
+                )
+            )
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        lines = []
+        for row in rows:
+            cells = [row[0].ljust(widths[0])]
+            cells += [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])]
+            lines.append("  ".join(cells).rstrip())
+        return "\n".join(lines)
+
+    def as_json(self):
+        return json.dumps([stats.as_dict() for stats in self.spans.values()], indent=2)
+
+    def prometheus(self):
+        """Format the spans for the node_exporter textfile collector."""
+        metrics = [
+            ("count", "count", "Number of times the span was entered."),
+            ("seconds", "seconds", "Wall time spent within the span."),
+            ("requests", "requests", "HTTP requests made within the span."),
+            ("sent", "sent_bytes", "Bytes of request bodies sent within the span."),
+            ("received", "received_bytes", "Bytes received within the span."),
+            ("retries", "retries", "Requests retried within the span."),
+        ]
+        lines = []
+        for attr, name, help in metrics:
+            lines.append(f"# HELP dobby_span_{name}_total {help}")
+            lines.append(f"# TYPE dobby_span_{name}_total counter")
+            for stats in self.spans.values():
+                label = escape_label(stats.name)
+                value = getattr(stats, attr)
+                lines.append(f'dobby_span_{name}_total{{span="{label}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write the spans to `path`, as JSON for `*.json` else for Prometheus."""
+        data = self.as_json() if path.suffix == ".json" else self.prometheus()
+        cache.write_atomic(path, data.encode())
+
+
+class NoTimings:
+    _span = contextlib.nullcontext()
+
+    def span(self, name):
+        return self._span
+
+
+NO_TIMINGS = NoTimings()
+
+
+def record(**counters):
+    """Add `counters` (see `COUNTERS`) to all active spans."""
+    for stats in _active.get():
+        for counter, value in counters.items():
+            setattr(stats, counter, getattr(stats, counter) + value)
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def route(url):
+    """Strip IDs from an API path, ie `/v1/job/{id}/plan`."""
+    parts = str(url).split("?")[0].split("/")
+    if len(parts) > 3 and parts[2] in ID_RESOURCES:
+        parts[3] = "{id}"
+    return "/".join(parts)
@@ -1,12 +1,20 @@
+import codecs
+import glob
+import gzip
 import inspect
+import json
+import random
+import re
 import sys
-from functools import update_wrapper
+import time
+from contextlib import contextmanager
+from functools import partial, update_wrapper
+from pathlib import Path
 
 import click
-from httpx import NetworkError
-from jinja2.exceptions import TemplateSyntaxError, UndefinedError
 
-from .config import Config
+from . import formatter, timings
+from .hcl import ParseError
 
 
 class ApiError(Exception):  # noqa
@@ -14,15 +22,469 @@ class ApiError(Exception):  # noqa
         self.response = response
 
 
-def hcl_to_json(config, hcl):
-    response = config.client.post("/v1/jobs/parse", json={"JobHCL": hcl})
+def handled_errors():
+    """The exceptions reported to the user without a traceback."""
+    from httpx import NetworkError
+    from jinja2.exceptions import TemplateSyntaxError, UndefinedError
+
+    return (ApiError, NetworkError, ParseError, TemplateSyntaxError, UndefinedError)
+
+
+def describe_error(e):
+    from httpx import NetworkError
+    from jinja2.exceptions import TemplateSyntaxError, UndefinedError
+
+    nl = "\n"
+    if isinstance(e, ApiError):
+        status, text = e.response.status_code, e.response.text.rstrip()
+        return f"API call failed with status code {status} and message:\n\n{text}"
+    elif isinstance(e, NetworkError):
+        return f"Network-error: {e.args[0]}"
+    elif isinstance(e, ParseError):
+        return f"Job parsing failed: {e}"
+    elif isinstance(e, TemplateSyntaxError):
+        return f"Template parsing failed: {e}{nl}"
+    elif isinstance(e, UndefinedError):
+        return f"Template rendering failed: {e}{nl}"
+
+
+class RawJob:
+    """A job as encoded by Nomad, which is passed on without re-encoding it.
+
+    Only the top-level fields Dobby needs (see `RAW_JOB_FIELDS`) are decoded,
+    so large jobs are neither fully decoded nor held in memory multiple times.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.fields = scan_fields(raw, RAW_JOB_FIELDS)
+
+    def __getitem__(self, key):
+        return self.fields[key]
+
+    def decode(self):
+        return json.loads(self.raw)
+
+
+RAW_JOB_FIELDS = ("ID", "Type")
+WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+# Bytes of a raw job decoded at first, grown until the fields are found
+SCAN_CHUNK_SIZE = 4096
+
+
+def scan_fields(raw, names, chunk_size=SCAN_CHUNK_SIZE):
+    """Decode the top-level `names` of the UTF-8 encoded JSON object `raw`.
+
+    Scanning stops once all of them are found, Nomad encodes `ID` and `Type`
+    before the (potentially huge) task groups. Thus only a prefix of `raw` is
+    decoded, which is extended while it ends before the fields do.
+    """
+    size = chunk_size
+    while True:
+        # An incomplete character at the end of the prefix is left out
+        text = codecs.getincrementaldecoder("utf-8")().decode(raw[:size])
+        truncated = size < len(raw)
+        try:
+            return _scan_fields(text, names, truncated)
+        except ValueError:
+            if not truncated:
+                raise
+        size *= 4
+
+
+def _scan_fields(text, names, truncated):
+    decoder = json.JSONDecoder()
+
+    def decode(pos):
+        value, pos = decoder.raw_decode(text, pos)
+        if truncated and pos == len(text):
+            # ie a number which continues after the prefix
+            raise ValueError("Truncated value")
+        return value, pos
+
+    def skip(pos, char=None):
+        pos = WHITESPACE_RE.match(text, pos).end()
+        if char is None:
+            return pos
+        if text[pos : pos + 1] != char:
+            raise ValueError(f"Expected {char!r} at position {pos}")
+        return WHITESPACE_RE.match(text, pos + 1).end()
+
+    found = {}
+    pos = skip(0, "{")
+    while len(found) < len(names) and text[pos : pos + 1] != "}":
+        key, pos = decode(pos)
+        value, pos = decode(skip(pos, ":"))
+        if key in names:
+            found[key] = value
+        pos = skip(pos)
+        if text[pos : pos + 1] == ",":
+            pos = skip(pos + 1)
+    return found
+
+
+def encode_json(obj):
+    """Encode `obj` as compact JSON (without whitespace)."""
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def job_body(job, **fields):
+    """Encode `{**fields, "Job": job}`, embedding a `RawJob` as is."""
+    raw = job.raw if isinstance(job, RawJob) else encode_json(job)
+    head = encode_json(fields)[:-1]
+    return head + (b',"Job":' if fields else b'"Job":') + raw + b"}"
+
+
+def send_json(config, method, path, body):
+    """Send the encoded JSON `body` to `path`.
+
+    With `config.gzip_requests` bodies of at least `GZIP_MIN_SIZE` bytes are
+    compressed, which requires a server (or proxy) accepting such requests.
+    """
+    headers = {"Content-Type": "application/json"}
+    size = len(body)
+    if config.gzip_requests and size >= GZIP_MIN_SIZE:
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return config.client.request(method, path, content=body, headers=headers)
+
+
+def send_job(config, method, path, job, **fields):
+    """Send `job` (a dict or `RawJob`) and `fields` as JSON body to `path`."""
+    return send_json(config, method, path, job_body(job, **fields))
+
+
+GZIP_MIN_SIZE = 1024
+
+
+class TransferStats:
+    """Count the bytes of request and response bodies, encoded and decoded.
+
+    The counts are added by `config.MeteredClient`, streamed responses (ie
+    the event stream) are not taken into account.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.sent = self.sent_encoded = 0
+        self.received = self.received_encoded = 0
+
+    def count(self, sent, sent_encoded, received, received_encoded):
+        self.requests += 1
+        self.sent += sent
+        self.sent_encoded += sent_encoded
+        self.received += received
+        self.received_encoded += received_encoded
+
+    def report(self):
+        return (
+            f"HTTP traffic of {self.requests} request(s): "
+            f"sent {describe_transfer(self.sent, self.sent_encoded)}, "
+            f"received {describe_transfer(self.received, self.received_encoded)}."
+        )
+
+
+def decoded_size(content, headers=None):
+    """The size of a request body before it was compressed by `send_json`."""
+    if not isinstance(content, bytes):
+        return 0
+    if headers and headers.get("Content-Encoding") == "gzip":
+        # The gzip trailer holds the size of the input (modulo 2**32)
+        return int.from_bytes(content[-4:], "little")
+    return len(content)
+
+
+def describe_transfer(size, encoded_size):
+    text = format_size(encoded_size)
+    if size != encoded_size:
+        saved = 100 - encoded_size * 100 // size
+        text += f" ({format_size(size)} uncompressed, {saved}% saved)"
+    return text
+
+
+def format_size(size):
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024 or unit == "MiB":
+            break
+        size /= 1024
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+
+
+async def hcl_to_json(config, hcl):
+    with config.timings.span("parse"):
+        return await _hcl_to_json(config, hcl)
+
+
+async def _hcl_to_json(config, hcl):
+    if config.parser == "local":
+        from . import jobspec
+
+        return jobspec.parse(hcl)
+
+    version = None
+    if config.parse_cache:
+        version = await config.server_version()
+        data = config.parse_cache.get(version, hcl) if version else None
+        if data is not None:
+            return RawJob(data)
+
+    body = encode_json({"JobHCL": hcl})
+    response = await send_json(config, "POST", "/v1/jobs/parse", body)
 
     if response.status_code == 200:
-        return response.json()
+        if version:
+            config.parse_cache.set(version, hcl, response.content)
+        return RawJob(response.content)
     else:
         raise ApiError(response)
 
 
+class ClientWrapper:
+    """Base class for wrappers of a `httpx.AsyncClient`.
+
+    Subclasses override `request` and `stream`, everything else is passed on
+    to the wrapped client.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    async def __aenter__(self):
+        await self.client.__aenter__()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.client.__aexit__(*args)
+
+    def request(self, method, url, **kwargs):
+        return self.client.request(method, url, **kwargs)
+
+    def stream(self, method, url, **kwargs):
+        return self.client.stream(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+
+# Responses worth retrying, ie while Nomad elects a new leader
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+# Initial interval in seconds when polling (see `BlockingQuery`)
+MIN_POLL_INTERVAL = 0.5
+
+
+class RetryPolicy:
+    """How often and how long to retry requests failing transiently.
+
+    Retries are delayed by an exponential backoff (starting at `backoff` and
+    capped at `max_backoff` seconds) with full jitter. Every `RetryBudget`
+    allows for `max_retries` retries, and stops retrying once a request kept
+    failing for longer than `deadline` seconds.
+    """
+
+    def __init__(self, max_retries=8, deadline=120, backoff=0.5, max_backoff=15):
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def budget(self):
+        return RetryBudget(self)
+
+
+class RetryBudget:
+    """The retries left for one phase (ie following an evaluation)."""
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.retries = 0
+
+    async def call(self, send):
+        """Await `send()` till it returns a response not worth retrying."""
+        import asyncio
+
+        import httpx
+
+        # Other transport errors (ie an unsupported scheme of the address or a
+        # broken proxy configuration) do not go away by trying again
+        transient = (
+            httpx.NetworkError,
+            httpx.TimeoutException,
+            httpx.RemoteProtocolError,
+        )
+        failing_since = None
+        attempt = 0
+        while True:
+            try:
+                response = await send()
+            except transient as e:
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                error = ApiError(response)
+
+            if failing_since is None:
+                failing_since = time.monotonic()
+            policy = self.policy
+            delay = random.uniform(
+                0, min(policy.max_backoff, policy.backoff * 2**attempt)
+            )
+            elapsed = time.monotonic() - failing_since
+            if self.retries >= policy.max_retries or elapsed + delay > policy.deadline:
+                raise error
+            self.retries += 1
+            attempt += 1
+            timings.record(retries=1)
+            await asyncio.sleep(delay)
+
+
+class BlockingQuery:
+    """Watch a Nomad resource via blocking queries.
+
+    The first call to `get` returns the current state, subsequent calls block
+    on the server (up to `config.wait_time` seconds) till the `X-Nomad-Index`
+    of the resource advances. If the server (or a proxy in between) does not
+    provide an index we fall back to polling: starting with a short interval
+    (right after a submission things change quickly) which grows up to
+    `config.poll_interval` while the resource does not change (ie while
+    waiting on canaries). Transient failures are retried as per
+    `config.retry_policy`.
+    """
+
+    def __init__(self, config, path):
+        self.config = config
+        self.path = path
+        self.index = None
+        self.blocking = True
+        self.retry = config.retry_policy.budget()
+        self.interval = min(MIN_POLL_INTERVAL, config.poll_interval)
+        self.content = None
+
+    async def get(self):
+        import asyncio
+
+        import httpx
+
+        params = {}
+        timeout = self.config.client.timeout
+        if self.index is not None:
+            if self.blocking:
+                wait = self.config.wait_time
+                params = {"index": self.index, "wait": f"{wait}s"}
+                # Nomad adds up to wait/16 of jitter to the wait time
+                timeout = httpx.Timeout(
+                    connect=timeout.connect,
+                    read=wait + wait / 16 + 5,
+                    write=timeout.write,
+                    pool=timeout.pool,
+                )
+            else:
+                await asyncio.sleep(self.interval)
+
+        response = await self.retry.call(
+            lambda: self.config.client.get(self.path, params=params, timeout=timeout)
+        )
+        if response.status_code != 200:
+            raise ApiError(response)
+
+        if response.content == self.content:
+            self.interval = min(self.interval * 1.5, self.config.poll_interval)
+        else:
+            self.interval = min(MIN_POLL_INTERVAL, self.config.poll_interval)
+        self.content = response.content
+
+        try:
+            index = int(response.headers["X-Nomad-Index"])
+        except (KeyError, ValueError):
+            self.blocking = False
+            index = 0
+        else:
+            # Reset the index if it went backwards (ie after a snapshot restore)
+            if index < (self.index or 0) or index < 1:
+                index = 1
+        self.index = index
+        return response.json()
+
+
+class JobOutput:
+    """Echo the output of a single job, `click.secho` compatible.
+
+    With a prefix (ie when deploying multiple jobs at once) every line is
+    prefixed and output produced within `block` is written at once, so the
+    output of concurrently running jobs does not interleave. With `err` all
+    output goes to stderr (ie when stdout is used for machine readable output).
+    """
+
+    def __init__(self, prefix=None, err=False):
+        self.prefix = prefix
+        self.buffer = None
+        self.err = err
+
+    def __call__(self, message="", nl=True, err=False, **styles):
+        err = err or self.err
+        if self.prefix is None:
+            click.secho(message, nl=nl, err=err, **styles)
+            return
+        text = click.style(str(message), **styles) if styles else str(message)
+        text += "\n" if nl else ""
+        if self.buffer is not None:
+            self.buffer.append(text)
+        else:
+            self.write(text, err)
+
+    def write(self, text, err=False):
+        prefix = click.style(f"{self.prefix} | ", bold=True)
+        lines = [prefix + line for line in text.splitlines(True)]
+        click.echo("".join(lines), nl=False, err=err)
+
+    @contextmanager
+    def block(self):
+        if self.prefix is None:
+            yield
+            return
+        self.buffer = []
+        try:
+            yield
+        finally:
+            text, self.buffer = "".join(self.buffer), None
+            self.write(text, self.err)
+
+
+def expand_inputs(inputs):
+    """Expand files, directories (`*.nomad` files within) and glob patterns."""
+    paths = []
+    for input in inputs:
+        if any(c in input for c in "*?["):
+            matches = [Path(m) for m in sorted(glob.glob(input, recursive=True))]
+        elif Path(input).is_dir():
+            matches = sorted(Path(input).glob("*.nomad"))
+        elif Path(input).is_file():
+            matches = [Path(input)]
+        else:
+            raise click.BadParameter(f"Path {input!r} does not exist.")
+        for path in matches:
+            path = path.resolve()
+            if path.is_file() and path not in paths:
+                paths.append(path)
+    if not paths:
+        raise click.BadParameter("No job files found.")
+    return paths
+
+
 class ConnectivityOption(click.Option):
     pass
 
@@ -69,24 +531,14 @@ class Command(click.Command):
 
 class Group(click.Group):
     def main(self, *args, **kwargs):
-        nl = "\n"
         try:
             return super().main(*args, **kwargs)
-        except ApiError as e:
-            status, text = e.response.status_code, e.response.text.rstrip()
-            click.secho(
-                f"API call failed with status code {status} and message:\n\n{text}",
-                fg="red",
-                err=True,
-            )
-        except NetworkError as e:
-            click.secho(f"Network-error: {e.args[0]}", fg="red", err=True)
-        except TemplateSyntaxError as e:
-            click.secho(f"Template parsing failed: {e}{nl}", fg="red", err=True)
-            raise
-        except UndefinedError as e:
-            click.secho(f"Template rendering failed: {e}{nl}", fg="red", err=True)
-            raise
+        except handled_errors() as e:
+            from jinja2.exceptions import TemplateSyntaxError, UndefinedError
+
+            click.secho(describe_error(e), fg="red", err=True)
+            if isinstance(e, (TemplateSyntaxError, UndefinedError)):
+                raise
 
         sys.exit(1)
 
@@ -116,13 +568,19 @@ def connectivity_options(f):
         click.option(
             "--region",
             envvar="NOMAD_REGION",
-            help="The region of the Nomad servers to forward commands to.",
+            help=(
+                "The region of the Nomad servers to forward commands to "
+                "(deploy accepts a comma separated list)."
+            ),
             **shared,
         ),
         click.option(
             "--namespace",
             envvar="NOMAD_NAMESPACE",
-            help="The target namespace for queries and actions bound to a namespace.",
+            help=(
+                "The target namespace for queries and actions bound to a namespace "
+                "(deploy accepts a comma separated list)."
+            ),
             **shared,
         ),
         click.option(
@@ -179,16 +637,289 @@ def connectivity_options(f):
             help="The SecretID of an ACL token to use to authenticate API requests with.",
             **shared,
         ),
+        click.option(
+            "--wait-time",
+            envvar="DOBBY_WAIT_TIME",
+            type=click.IntRange(1, 600),
+            default=300,
+            help="Maximum time in seconds a blocking query waits for changes on the server.",
+            show_default=True,
+            **shared,
+        ),
+        click.option(
+            "--poll-interval",
+            envvar="DOBBY_POLL_INTERVAL",
+            type=click.FloatRange(0),
+            default=3,
+            help=(
+                "Maximum polling interval in seconds if the server does not "
+                "support blocking queries."
+            ),
+            show_default=True,
+            **shared,
+        ),
+        click.option(
+            "--max-retries",
+            envvar="DOBBY_MAX_RETRIES",
+            type=click.IntRange(0),
+            default=8,
+            help="Retries per evaluation/deployment on network errors and 5xx responses.",
+            show_default=True,
+            **shared,
+        ),
+        click.option(
+            "--retry-deadline",
+            envvar="DOBBY_RETRY_DEADLINE",
+            type=click.FloatRange(0),
+            default=120,
+            help="Seconds after which a request failing repeatedly is given up on.",
+            show_default=True,
+            **shared,
+        ),
+        click.option(
+            "--parse-cache/--no-parse-cache",
+            envvar="DOBBY_PARSE_CACHE",
+            default=True,
+            help="Cache the results of parsing job specifications on disk.",
+            show_default=True,
+            **shared,
+        ),
+        click.option(
+            "--gzip-requests/--no-gzip-requests",
+            envvar="DOBBY_GZIP_REQUESTS",
+            default=False,
+            help=(
+                "Compress large request bodies (ie jobs) with gzip, the server "
+                "or a proxy in front of it must accept compressed requests."
+            ),
+            show_default=True,
+            **shared,
+        ),
+        click.option(
+            "--transfer-stats",
+            envvar="DOBBY_TRANSFER_STATS",
+            is_flag=True,
+            default=False,
+            help="Report the number of bytes sent and received on exit.",
+            **shared,
+        ),
+        *timings_option_args(**shared),
+        click.option(
+            "--parser",
+            envvar="DOBBY_PARSER",
+            type=click.Choice(["remote", "local"]),
+            default="remote",
+            help=(
+                "Parse job specifications via the Nomad API or locally "
+                "(HCL1 only, no network round trip)."
+            ),
+            show_default=True,
+            **shared,
+        ),
     ]
     for arg in args[::-1]:
         arg(f)
     return f
 
 
-def template_options(f):
+def read_targets_file(ctx, param, value):
+    """Load a YAML/JSON list of `{region: ..., namespace: ...}` targets."""
+    if value is None:
+        return None
+
+    import yaml
+
+    from .config import Target
+
+    with open(value) as fh:
+        try:
+            data = yaml.safe_load(fh)
+        except yaml.YAMLError as e:
+            raise click.BadParameter(f"Invalid targets file: {e}")
+    if not isinstance(data, list) or not data:
+        raise click.BadParameter("The targets file must contain a list of targets.")
+    targets = []
+    for item in data:
+        if not isinstance(item, dict) or set(item) - {"region", "namespace"}:
+            raise click.BadParameter(
+                f"Invalid target {item!r}, expected a region and/or namespace."
+            )
+        targets.append(Target(item.get("region"), item.get("namespace")))
+    return targets
+
+
+def monitor_options(f):
+    return click.option(
+        "--monitor",
+        "monitor_mode",
+        type=click.Choice(["blocking", "events"]),
+        default="blocking",
+        envvar="DOBBY_MONITOR",
+        show_default=True,
+        help=(
+            "Follow evaluations and deployments via blocking queries or via "
+            "the Nomad event stream (falls back to blocking queries if unavailable)."
+        ),
+    )(f)
+
+
+def output_options(f):
+    return click.option(
+        "--output",
+        type=click.Choice(["text", "json", "ndjson"]),
+        default="text",
+        envvar="DOBBY_OUTPUT",
+        show_default=True,
+        help=(
+            "Output format of the plan. With json/ndjson a structured summary is "
+            "written to stdout and progress messages go to stderr."
+        ),
+    )(f)
+
+
+def diff_options(f):
+    """Add options limiting the printed diff, passed on as `diff_options`."""
+
+    def new_func(*args, **kwargs):
+        kwargs["diff_options"] = formatter.DiffOptions(
+            kwargs.pop("diff_depth"),
+            kwargs.pop("diff_max_fields"),
+            kwargs.pop("diff_max_value"),
+            kwargs.pop("diff_filter"),
+        )
+        return f(*args, **kwargs)
+
+    args = [
+        click.option(
+            "--diff-depth",
+            type=click.IntRange(0),
+            help="Collapse objects nested deeper than this in the diff.",
+        ),
+        click.option(
+            "--diff-max-fields",
+            type=click.IntRange(1),
+            help="Maximum number of fields shown per object in the diff.",
+        ),
+        click.option(
+            "--diff-max-value",
+            type=click.IntRange(8),
+            help="Truncate longer values in the diff (a hash of the value is appended).",
+        ),
+        click.option(
+            "--diff-filter",
+            multiple=True,
+            metavar="GLOB",
+            help=(
+                "Only show fields whose path (ie 'TaskGroup[api].Task[web].Config.*') "
+                "matches. Can be specified multiple times."
+            ),
+        ),
+    ]
+    new_func = update_wrapper(new_func, f)
+    for arg in args[::-1]:
+        arg(new_func)
+    return new_func
+
+
+def timings_option_args(**kwargs):
+    return [
+        click.option(
+            "--timings",
+            envvar="DOBBY_TIMINGS",
+            is_flag=True,
+            default=False,
+            help="Report the time spent per phase and HTTP request on exit.",
+            **kwargs,
+        ),
+        click.option(
+            "--timings-file",
+            envvar="DOBBY_TIMINGS_FILE",
+            type=click.Path(dir_okay=False, writable=True),
+            help=(
+                "Write the timings to a file, as JSON for `*.json` files and in "
+                "the Prometheus text format otherwise."
+            ),
+            **kwargs,
+        ),
+    ]
+
+
+def timings_options(f):
+    """Add the timings options to commands without connectivity options.
+
+    The `Timings` (or `NO_TIMINGS`) are passed on as `timings` and reported
+    once the command finished.
+    """
+
+    def new_func(*args, **kwargs):
+        print_timings, path = kwargs.pop("timings"), kwargs.pop("timings_file")
+        spans = timings.Timings() if print_timings or path else timings.NO_TIMINGS
+        kwargs["timings"] = spans
+        try:
+            return f(*args, **kwargs)
+        finally:
+            if print_timings:
+                click.echo(spans.table(), err=True)
+            if path:
+                spans.write(Path(path))
+
+    new_func = update_wrapper(new_func, f)
+    for arg in timings_option_args(show_envvar=True)[::-1]:
+        arg(new_func)
+    return new_func
+
+
+def profile_options(f):
+    """Add options profiling the rendering, passed on as `profiler`.
+
+    The report is written to stderr once the command finished.
+    """
+
+    def new_func(*args, **kwargs):
+        from .profiling import TemplateProfiler
+
+        profile, profile_out = kwargs.pop("profile"), kwargs.pop("profile_out")
+        profiler = None
+        if profile or profile_out:
+            profiler = TemplateProfiler(profile_out)
+        kwargs["profiler"] = profiler
+        try:
+            return f(*args, **kwargs)
+        finally:
+            if profiler:
+                click.echo(profiler.report(), err=True)
+                profiler.dump_stats()
+
+    args = [
+        click.option(
+            "--profile",
+            is_flag=True,
+            default=False,
+            help="Report the time spent per template and macro to stderr.",
+        ),
+        click.option(
+            "--profile-out",
+            type=click.Path(dir_okay=False, writable=True),
+            help="Additionally write a cProfile (pstats) file of the rendering.",
+        ),
+    ]
+    new_func = update_wrapper(new_func, f)
+    for arg in args[::-1]:
+        arg(new_func)
+    return new_func
+
+
+def template_options(f=None, multiple=False):
+    if f is None:
+        return partial(template_options, multiple=multiple)
+
     path_type = click.Path(
         exists=True, allow_dash=False, file_okay=True, dir_okay=False, resolve_path=True
     )
+    if multiple:
+        input_argument = click.argument("inputs", nargs=-1)
+    else:
+        input_argument = click.argument("input", type=path_type)
     args = [
         click.option(
             "--var-file",
@@ -201,18 +932,27 @@ def template_options(f):
                 "the template with. Can be specified multiple times."
             ),
         ),
-        click.argument("input", type=path_type),
+        input_argument,
     ]
     for arg in args[::-1]:
         arg(f)
     return f
 
 
-def pass_config(f):
-    config_initargs = inspect.signature(Config).parameters.keys()
+def pass_config(f=None, multi_target=False):
+    """Pass a `Config` built from the connectivity options.
+
+    Multiple regions/namespaces are refused unless `multi_target` is set.
+    """
+    if f is None:
+        return partial(pass_config, multi_target=multi_target)
 
     @click.pass_context
     def new_func(ctx, *args, **kwargs):
+        from . import runner
+        from .config import Config
+
+        config_initargs = inspect.signature(Config).parameters.keys()
         config_values = {}
         for arg in config_initargs:
             config_values[arg] = kwargs.pop(arg)
@@ -220,6 +960,22 @@ def pass_config(f):
         client_key = config_values["client_key"]
         if any([client_cert, client_key]) and not all([client_cert, client_key]):
             ctx.fail("-client-cert requires -client-key (and vice versa).")
-        return f(Config(**config_values), *args, **kwargs)
+        config = Config(**config_values)
+        if len(config.targets) > 1 and not multi_target:
+            ctx.fail("Multiple regions or namespaces are only supported by deploy.")
+
+        async def run_command():
+            try:
+                async with config.client:
+                    return await f(config, *args, **kwargs)
+            finally:
+                if config.transfer_stats:
+                    click.echo(config.transfer_stats.report(), err=True)
+                if config.print_timings:
+                    click.echo(config.timings.table(), err=True)
+                if config.timings_file:
+                    config.timings.write(config.timings_file)
+
+        return runner.run(run_command())
 
     return update_wrapper(new_func, f)
@@ -0,0 +1,24 @@
+from pathlib import Path
+
+import pytest
+
+from .nomad import FakeNomad
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep the on-disk caches of the tests apart from the user's cache."""
+    path = tmp_path / "cache"
+    monkeypatch.setenv("DOBBY_CACHE_DIR", str(path))
+    return path
+
+
+@pytest.fixture
+def root():
+    return Path(__file__).parent
+
+
+@pytest.fixture
+def nomad():
+    with FakeNomad() as nomad:
+        yield nomad
@@ -0,0 +1,81 @@
+"""A tiny stand-in for the Nomad HTTP API to test against."""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def handle_request(self):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        self.server.nomad.requests.append((self.command, url.path, query, body))
+
+        route = self.server.nomad.routes.get((self.command, url.path))
+        if route is None:
+            status, headers, content = 404, {}, b"not found"
+        else:
+            status, headers, content = route(query, body)
+
+        if isinstance(content, (dict, list)):
+            content = json.dumps(content).encode()
+        elif isinstance(content, str):
+            content = content.encode()
+
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        if hasattr(content, "__next__"):
+            # Stream the response, one chunk per yielded item
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in content:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    do_GET = do_PUT = do_POST = do_DELETE = handle_request
+
+
+class FakeNomad:
+    """Serve `routes` ({(method, path): handler}) on a random local port.
+
+    A handler is called with the query parameters and the request body and
+    returns a tuple of (status, headers, content).
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.nomad = self
+        self.address = "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def route(self, method, path):
+        def decorator(f):
+            self.routes[(method, path)] = f
+            return f
+
+        return decorator
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
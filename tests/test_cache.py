@@ -0,0 +1,104 @@
+import datetime
+import os
+import pickle
+
+import pytest
+
+from dobby import runner
+from dobby.cache import ParseCache, VarsCache
+from dobby.config import Config
+from dobby.utils import hcl_to_json
+
+
+@pytest.fixture
+def nomad(nomad):
+    @nomad.route("GET", "/v1/agent/self")
+    def agent(query, body):
+        return 200, {}, {"member": {"Tags": {"build": "1.0.1"}}}
+
+    @nomad.route("POST", "/v1/jobs/parse")
+    def parse(query, body):
+        return 200, {}, {"ID": "example", "Type": "service"}
+
+    return nomad
+
+
+def parse(config):
+    async def closing():
+        async with config.client:
+            return await hcl_to_json(config, 'job "example" {}')
+
+    return runner.run(closing())
+
+
+def test_parse_cache(nomad):
+    for _ in range(2):
+        config = Config(nomad.address, *[None] * 7)
+        job = parse(config)
+        assert job.decode() == {"ID": "example", "Type": "service"}
+
+    paths = [r[1] for r in nomad.requests]
+    assert paths == ["/v1/agent/self", "/v1/jobs/parse"]
+
+
+def test_no_parse_cache(nomad):
+    for _ in range(2):
+        config = Config(nomad.address, *[None] * 7, parse_cache=False)
+        parse(config)
+
+    assert [r[1] for r in nomad.requests] == ["/v1/jobs/parse"] * 2
+
+
+def test_parse_cache_eviction(tmp_path):
+    cache = ParseCache(tmp_path, max_size=25)
+    cache.set("1.0.1", "a", b"0123456789")
+    cache.set("1.0.1", "b", b"0123456789")
+    # Make "a" the most recently used entry
+    os.utime(cache._entry("1.0.1", "b"), (0, 0))
+    assert cache.get("1.0.1", "a") == b"0123456789"
+
+    cache.set("1.0.1", "c", b"0123456789")
+    assert cache.get("1.0.1", "a") is not None
+    assert cache.get("1.0.1", "b") is None
+    assert cache.get("1.0.1", "c") is not None
+    assert cache.get("1.0.2", "a") is None
+
+
+def test_unknown_server_version(nomad):
+    nomad.route("GET", "/v1/agent/self")(lambda query, body: (403, {}, "denied"))
+
+    for _ in range(2):
+        config = Config(nomad.address, *[None] * 7)
+        parse(config)
+
+    # The failed lookup is remembered, the parse result is not cached
+    paths = [r[1] for r in nomad.requests]
+    assert paths == ["/v1/agent/self", "/v1/jobs/parse", "/v1/jobs/parse"]
+
+
+def test_cache_permissions(tmp_path):
+    umask = os.umask(0o022)
+    try:
+        ParseCache(tmp_path / "cache").set("1.0.1", "a", b"secret")
+    finally:
+        os.umask(umask)
+    entry = ParseCache(tmp_path / "cache")._entry("1.0.1", "a")
+    assert entry.stat().st_mode & 0o777 == 0o600
+    for path in (entry.parent, entry.parent.parent, tmp_path / "cache"):
+        assert path.stat().st_mode & 0o777 == 0o700
+
+
+def test_vars_cache(tmp_path):
+    var_file = tmp_path / "vars.yml"
+    var_file.write_text("a: 1\n")
+    entry = VarsCache("fp", tmp_path).set([var_file], {"a": [1, "b"]})
+    VarsCache._loaded.clear()
+    assert VarsCache("fp", tmp_path).get([var_file]) == {"a": [1, "b"]}
+
+    # Only plain data is loaded from the cache
+    entry.write_bytes(pickle.dumps({"a": 1}))
+    VarsCache._loaded.clear()
+    assert VarsCache("fp", tmp_path).get([var_file]) is None
+    assert (
+        VarsCache("fp", tmp_path).set([var_file], {"a": datetime.date.today()}) is None
+    )
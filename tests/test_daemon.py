@@ -0,0 +1,94 @@
+import io
+import json
+import socket
+import threading
+from pathlib import Path
+
+from dobby import config, daemon
+from dobby.cli import run_cli
+
+from .nomad import FakeNomad
+
+ROOT = Path(__file__).parent
+
+
+def forward(path, *args):
+    stdout, stderr = io.BytesIO(), io.BytesIO()
+    status = daemon.forward(list(args), path, stdout, stderr)
+    return status, stdout.getvalue().decode(), stderr.getvalue().decode()
+
+
+def test_serve(tmp_path):
+    path = str(tmp_path / "serve.sock")
+    server = daemon.Server(path, run_cli)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        template = str(ROOT / "templates" / "simple.txt")
+        var_file = str(ROOT / "vars" / "simple.yml")
+        status, out, _ = forward(path, "render", "--var-file", var_file, template)
+        assert (status, out.splitlines()[0]) == (0, "job_name = test")
+
+        status, _, err = forward(path, "render", str(tmp_path / "missing.txt"))
+        assert status == 2
+        assert "does not exist" in err
+
+        with FakeNomad() as nomad:
+            nomad.route("POST", "/v1/jobs/parse")(
+                lambda query, body: (200, {}, {"ID": "api", "Type": "service"})
+            )
+            nomad.route("POST", "/v1/validate/job")(
+                lambda query, body: (200, {}, {"Error": "", "Warnings": ""})
+            )
+            job = str(ROOT / "jobs" / "api.nomad")
+            var_file = str(ROOT / "jobs" / "vars.yml")
+            args = ["validate", "--address", nomad.address, "--var-file", var_file]
+            for _ in range(2):
+                status, out, _ = forward(path, *args, job)
+                assert (status, out) == (0, "Validated job spec successfully!\n")
+            # Both commands used the same client
+            assert len(config._shared_clients) == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+    assert config._shared_clients is None
+    assert daemon.forward(["render", template], path) is None
+
+
+def test_serve_refuses(tmp_path, monkeypatch):
+    path = str(tmp_path / "serve.sock")
+    started, finish = threading.Event(), threading.Event()
+
+    def run(args):
+        started.set()
+        finish.wait(5)
+
+    server = daemon.Server(path, run)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        # Commands run in-process while the daemon is busy
+        busy = threading.Thread(target=forward, args=(path, "deploy"))
+        busy.start()
+        assert started.wait(5)
+        assert daemon.forward(["render"], path) is None
+        finish.set()
+        busy.join()
+        assert forward(path, "render")[0] == 0
+
+        # ... and if the daemon runs another version of dobby
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            sock.sendall(json.dumps({"version": "0.0.0"}).encode() + b"\n")
+            header = sock.makefile("rb").read(daemon.FRAME_HEADER.size)
+            assert daemon.FRAME_HEADER.unpack(header)[0] == b"r"
+
+        # The environment is not sent to a socket of another user
+        monkeypatch.setattr(daemon.os, "getuid", lambda: -1)
+        assert daemon.forward(["render"], path) is None
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
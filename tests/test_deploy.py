@@ -0,0 +1,237 @@
+import json
+import re
+import threading
+import time
+from collections import Counter
+
+import pytest
+from click.testing import CliRunner
+
+from dobby.cli import cli
+
+FAILED_ALLOCS = {
+    "web": {
+        "CoalescedFailures": 0,
+        "NodesEvaluated": 0,
+        "NodesAvailable": None,
+        "ClassFiltered": None,
+        "NodesExhausted": 0,
+        "ClassExhausted": None,
+        "DimensionExhausted": None,
+        "QuotaExhausted": None,
+    }
+}
+
+
+@pytest.fixture
+def nomad(nomad):
+    @nomad.route("POST", "/v1/jobs/parse")
+    def parse(query, body):
+        hcl = json.loads(body)["JobHCL"]
+        id = re.match(r'job "(.+)"', hcl).group(1)
+        return 200, {}, {"ID": id, "Type": "service"}
+
+    @nomad.route("PUT", "/v1/jobs")
+    def register(query, body):
+        id = json.loads(body)["Job"]["ID"]
+        return 200, {}, {"EvalID": f"eval-{id}"}
+
+    for id in ("test-api", "test-web"):
+        failed = FAILED_ALLOCS if id == "test-web" else None
+        plan = {
+            "Diff": None,
+            "FailedTGAllocs": failed,
+            "JobModifyIndex": 7,
+            "CreatedEvals": None,
+        }
+        nomad.route("PUT", f"/v1/job/{id}/plan")(
+            lambda query, body, plan=plan: (200, {}, plan)
+        )
+        evaluation = {"ID": f"eval-{id}", "Status": "complete"}
+        nomad.route("GET", f"/v1/evaluation/eval-{id}")(
+            lambda query, body, evaluation=evaluation: (200, {}, evaluation)
+        )
+    return nomad
+
+
+def test_batch_deploy(nomad, root):
+    args = ["deploy", "--address", nomad.address, "--var-file", root / "jobs/vars.yml"]
+    result = CliRunner().invoke(cli, args + [str(root / "jobs/*.nomad")])
+    assert result.exit_code == 1
+    assert "api | - Evaluation 'eval-test-api' completed successfully." in result.output
+    assert "web | Aborting execution due to failed allocations." in result.output
+    assert result.output.endswith(
+        "Summary:\n- 'test-api' (api.nomad): deployed\n- 'test-web' (web.nomad): aborted\n"
+    )
+    registered = [json.loads(r[3]) for r in nomad.requests if r[1] == "/v1/jobs"]
+    assert registered == [
+        {
+            "Job": {"ID": "test-api", "Type": "service"},
+            "JobModifyIndex": 7,
+            "EnforceIndex": True,
+        }
+    ]
+
+
+def test_single_deploy(nomad, root):
+    args = ["deploy", "--address", nomad.address, "--var-file", root / "jobs/vars.yml"]
+    result = CliRunner().invoke(cli, args + [str(root / "jobs/api.nomad")])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[-1] == "Job deployment finished succesfully."
+    assert "Summary" not in result.output
+
+
+def test_deploy_ndjson(nomad, root):
+    args = ["deploy", "--address", nomad.address, "--var-file", root / "jobs/vars.yml"]
+    args += ["--output", "ndjson", str(root / "jobs/*.nomad")]
+    result = CliRunner(mix_stderr=False).invoke(cli, args)
+    assert result.exit_code == 1
+    records = sorted(
+        map(json.loads, result.stdout.splitlines()), key=lambda r: r["job"]
+    )
+    assert [(r["job"], r["status"]) for r in records] == [
+        ("test-api", "deployed"),
+        ("test-web", "aborted"),
+    ]
+    assert records[1]["plan"]["failed_allocations"] == {"web": FAILED_ALLOCS["web"]}
+    assert "Summary:" in result.stderr
+
+
+def test_deploy_skip_unchanged(nomad, root):
+    unchanged = {
+        "Diff": {
+            "Type": "None",
+            "ID": "test-api",
+            "Fields": None,
+            "Objects": None,
+            "TaskGroups": [],
+        },
+        "FailedTGAllocs": None,
+        "JobModifyIndex": 7,
+        "CreatedEvals": None,
+    }
+    nomad.route("PUT", "/v1/job/test-api/plan")(
+        lambda query, body: (200, {}, unchanged)
+    )
+    args = ["deploy", "--address", nomad.address, "--var-file", root / "jobs/vars.yml"]
+    args += ["--skip-unchanged", str(root / "jobs/api.nomad")]
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0
+    assert result.output.splitlines()[-1] == "Job is unchanged, skipping submission."
+    assert not [r for r in nomad.requests if r[1] == "/v1/jobs"]
+
+
+def test_deploy_saved_plan(nomad, root, tmp_path):
+    plan_file = tmp_path / "api.plan"
+    args = ["--address", nomad.address, "--var-file", root / "jobs/vars.yml"]
+    args += [str(root / "jobs/api.nomad")]
+    result = CliRunner().invoke(cli, ["plan", "--out", str(plan_file)] + args)
+    assert result.exit_code == 0
+
+    del nomad.requests[:]
+    args = ["deploy", "--address", nomad.address, "--plan", str(plan_file)]
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0
+    assert [r[1] for r in nomad.requests][:1] == ["/v1/jobs"]
+    assert json.loads(nomad.requests[0][3])["JobModifyIndex"] == 7
+
+    @nomad.route("PUT", "/v1/jobs")
+    def conflict(query, body):
+        message = "Enforcing job modify index 7: job exists with conflicting job modify index: 9"
+        return 500, {}, message
+
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 1
+    assert "it changed since it was planned" in result.output
+
+    del nomad.requests[:]
+    result = CliRunner().invoke(cli, args + ["--region", "eu,us"])
+    assert result.exit_code == 1
+    assert "it was planned against http://127.0.0.1" in result.output
+    assert not nomad.requests
+
+    plan_file.write_text(json.dumps({"Version": 2, "Job": {"ID": "x"}}))
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 1
+    assert "missing: Address, Region, Namespace, JobModifyIndex" in result.output
+    assert not nomad.requests
+
+
+def test_deploy_regions(nomad, root):
+    args = ["deploy", "--address", nomad.address, "--var-file", root / "jobs/vars.yml"]
+    args += ["--region", "eu,us", str(root / "jobs/api.nomad")]
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0
+    assert "eu | - Evaluation 'eval-test-api' completed successfully." in result.output
+    assert result.output.endswith(
+        "Summary:\n- 'test-api' (api.nomad in eu): deployed\n"
+        "- 'test-api' (api.nomad in us): deployed\n"
+    )
+    registered = [r[2] for r in nomad.requests if r[1] == "/v1/jobs"]
+    assert sorted(q["region"] for q in registered) == ["eu", "us"]
+
+
+def test_deploy_parallelism_per_target(nomad, root):
+    lock = threading.Lock()
+    active, most = Counter(), Counter()
+
+    def plan(query, body):
+        region = query["region"]
+        with lock:
+            active[region] += 1
+            most[region] = max(most[region], active[region])
+        time.sleep(0.1)
+        with lock:
+            active[region] -= 1
+        data = {"Diff": None, "FailedTGAllocs": None, "JobModifyIndex": 7}
+        return 200, {}, dict(data, CreatedEvals=None)
+
+    for id in ("test-api", "test-web"):
+        nomad.route("PUT", f"/v1/job/{id}/plan")(plan)
+    args = ["deploy", "--address", nomad.address, "--var-file", root / "jobs/vars.yml"]
+    args += ["-j", "1", "--region", "eu,us", "--detach"]
+    args += [str(root / "jobs/api.nomad"), str(root / "jobs/web.nomad")]
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert most == {"eu": 1, "us": 1}
+
+
+def test_deploy_canary(nomad, root, tmp_path):
+    targets = tmp_path / "targets.yml"
+    targets.write_text("- region: eu\n- {region: us, namespace: prod}\n")
+    args = ["deploy", "--address", nomad.address, "--var-file", root / "jobs/vars.yml"]
+    args += ["--targets-file", targets, "--canary", str(root / "jobs/web.nomad")]
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 1
+    assert "Canary deployment to 'eu' failed" in result.output
+    assert {r[2].get("region") for r in nomad.requests} == {"eu"}
+
+    del nomad.requests[:]
+    result = CliRunner(env={"NOMAD_REGION": "eu"}).invoke(cli, args)
+    assert result.exit_code == 2
+    assert "cannot be combined with --region" in result.output
+    assert not nomad.requests
+
+
+def test_multiple_regions_unsupported(root):
+    args = ["plan", "--region", "eu,us", str(root / "jobs/api.nomad")]
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 2
+    assert "only supported by deploy" in result.output
+
+
+def test_deploy_timings(nomad, root, tmp_path):
+    args = ["deploy", "--address", nomad.address, "--var-file", root / "jobs/vars.yml"]
+    args += ["--timings", "--timings-file", tmp_path / "dobby.prom"]
+    result = CliRunner(mix_stderr=False).invoke(
+        cli, args + [str(root / "jobs/api.nomad")]
+    )
+    assert result.exit_code == 0
+    spans = [line.split()[0] for line in result.stderr.splitlines()[1:]]
+    # Nomad is connected to while the job is rendered
+    assert spans[:4] == ["connect", "http", "render", "parse"]
+    assert {"plan", "submit", "monitor"} <= set(spans)
+
+    metrics = (tmp_path / "dobby.prom").read_text()
+    assert 'dobby_span_requests_total{span="http PUT /v1/job/{id}/plan"} 1' in metrics
+    assert 'dobby_span_requests_total{span="plan"} 1' in metrics
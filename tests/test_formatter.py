@@ -0,0 +1,74 @@
+import hashlib
+import json
+from pathlib import Path
+
+import click
+import pytest
+
+from dobby import formatter
+
+PLANS = Path(__file__).parent / "plans"
+
+
+@pytest.mark.parametrize("verbose", [False, True])
+def test_format_job_diff(verbose):
+    diff = json.loads((PLANS / "diff.json").read_text())
+    expected = (PLANS / f"diff{'-verbose' if verbose else ''}.txt").read_text()
+    assert formatter.format_job_diff(diff, verbose) == expected
+    assert "".join(formatter.iter_job_diff(diff, verbose)) == expected
+
+
+def test_plan_summary():
+    diff = json.loads((PLANS / "diff.json").read_text())
+    failed = {"web": {"CoalescedFailures": 1, "NodesEvaluated": 3, "ScoreMetaData": []}}
+    resp = {"Diff": diff, "FailedTGAllocs": failed, "JobModifyIndex": 7}
+    summary = formatter.plan_summary(resp, {"ID": "example"})
+
+    assert summary["type"] == "Edited"
+    assert summary["task_groups"]["api"] == {
+        "type": "Edited",
+        "updates": {"create/destroy update": 2, "ignore": 1, "canary": 1, "weird": 3},
+    }
+    assert summary["failed_allocations"] == {
+        "web": {"CoalescedFailures": 1, "NodesEvaluated": 3}
+    }
+    changes = {c["path"]: c for c in summary["changes"]}
+    assert "AllAtOnce" not in changes
+    assert changes["Priority"]["old"] == "50"
+    assert changes["TaskGroup[api].Count"]["annotations"] == ["forces create"]
+    assert changes["TaskGroup[api].Task[web].Config.image"]["new"] == 'b:"2"'
+    assert changes["TaskGroup[api].Task[old]"]["type"] == "Deleted"
+
+
+def test_format_job_diff_limits():
+    diff = json.loads((PLANS / "diff.json").read_text())
+    options = formatter.DiffOptions(
+        depth=1, max_fields=1, max_value=8, filters=["TaskGroup[api].*"]
+    )
+    lines = click.unstyle(formatter.format_job_diff(diff, True, options)).splitlines()
+    assert lines[1:7] == [
+        '+/- Task Group: "api" (1 canary, 2 create/destroy update, 1 ignore, 3 weird)',
+        '  +/- Count: "2" => "3" (forces create)',
+        "  +   Network {",
+        '      + Mode: "bridge"',
+        "      + Static Port { ... }",
+        "      }",
+    ]
+    assert "          ... (1 more field)" in lines
+    assert not any("Priority" in line for line in lines)
+
+    diff["TaskGroups"][0]["Tasks"][0]["Objects"][1]["Fields"][0]["New"] = "x" * 100
+    options = formatter.DiffOptions(max_value=8, filters=["*.Env.KEY"])
+    lines = click.unstyle(formatter.format_job_diff(diff, False, options)).splitlines()
+    digest = hashlib.sha256(b"x" * 100).hexdigest()[:12]
+    assert f'      + KEY: "xxxxxxxx... (100 chars, sha256:{digest})"' in lines
+    assert not any("Config" in line for line in lines)
+    # Task groups and tasks without a matching path are left out entirely
+    assert not any("cache" in line or "sidecar" in line for line in lines)
+
+    options = formatter.DiffOptions(filters=["TaskGroup[api].Task[old]"])
+    lines = click.unstyle(formatter.format_job_diff(diff, False, options)).splitlines()
+    assert [line.strip() for line in lines if line.strip()][1:] == [
+        '+/- Task Group: "api" (1 canary, 2 create/destroy update, 1 ignore, 3 weird)',
+        '- Task: "old" (forces destroy)',
+    ]
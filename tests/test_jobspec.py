@@ -0,0 +1,76 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from dobby import formatter, jobspec
+from dobby.hcl import ParseError
+
+CORPUS = sorted((Path(__file__).parent / "parse").glob("*.nomad"))
+
+
+def normalize(value):
+    """Drop empty values, `/v1/jobs/parse` returns every field of the job."""
+    if isinstance(value, dict):
+        value = {k: normalize(v) for k, v in value.items()}
+        return {k: v for k, v in value.items() if v not in (None, "", False, 0, [])}
+    elif isinstance(value, list):
+        return [normalize(v) for v in value]
+    return value
+
+
+@pytest.mark.parametrize("path", CORPUS, ids=[p.stem for p in CORPUS])
+def test_parse_corpus(path):
+    expected = json.loads(path.with_suffix(".json").read_text())
+    # Responses of the API contain every field, set or not
+    assert expected["Namespace"] is None
+    assert normalize(jobspec.parse(path.read_text())) == normalize(expected)
+
+
+def test_weak_decoding():
+    job = jobspec.parse(
+        """
+        job "example" {
+          priority = "50"
+          all_at_once = "true"
+          datacenters = "dc1"
+          meta {
+            count = 3
+            enabled = true
+          }
+          group "g" {
+            shutdown_delay = "1m30s"
+            task "t" { driver = "raw_exec" }
+          }
+        }
+        """
+    )
+    assert job["Priority"] == 50
+    assert job["AllAtOnce"] is True
+    assert job["Datacenters"] == ["dc1"]
+    assert job["Meta"] == {"count": "3", "enabled": "1"}
+    assert job["TaskGroups"][0]["ShutdownDelay"] == 90 * 10**9
+
+
+def test_job_without_type():
+    job = jobspec.parse('job "x" { group "g" { task "t" { driver = "docker" } } }')
+    assert job["Type"] is None
+
+    metrics = dict.fromkeys(formatter.ALLOC_METRICS)
+    metrics.update(CoalescedFailures=0, NodesEvaluated=0, NodesExhausted=0)
+    resp = {"CreatedEvals": None, "FailedTGAllocs": {"g": metrics}}
+    assert "Failed to place all allocations" in formatter.format_dry_run(resp, job)
+
+
+@pytest.mark.parametrize(
+    "src, message",
+    [
+        ('job "x" { foo = 1 }', "invalid key: foo"),
+        ("job { }", "'job' block missing name"),
+        ('group "x" { }', "'job' stanza not found"),
+        ('job "x" { type = "service"', "expected key"),
+    ],
+)
+def test_parse_errors(src, message):
+    with pytest.raises(ParseError, match=message):
+        jobspec.parse(src)
@@ -0,0 +1,152 @@
+import time
+
+import httpx
+import pytest
+
+from dobby import runner
+from dobby.config import Config
+from dobby.monitor import EventMonitor, Watch
+from dobby.utils import ApiError, RetryPolicy
+
+
+def make_config(address, **kwargs):
+    return Config(address, None, None, None, None, None, None, None, **kwargs)
+
+
+def run(config, coro):
+    async def closing():
+        async with config.client:
+            return await coro
+
+    return runner.run(closing())
+
+
+def test_monitor_evaluation_blocking(nomad):
+    @nomad.route("GET", "/v1/evaluation/e1")
+    def evaluation(query, body):
+        index = int(query.get("index", 0))
+        status = "pending" if index < 10 else "complete"
+        eval = {"ID": "e1", "Status": status, "DeploymentID": "d1"}
+        return 200, {"X-Nomad-Index": str(max(index + 5, 5))}, eval
+
+    output = []
+    watch = Watch(eval_id="e1", follow_deployment=False, echo=output.append)
+    start = time.monotonic()
+    config = make_config(nomad.address)
+    assert run(config, watch.poll(config))
+    assert time.monotonic() - start < 1
+    assert watch.deployment_id == "d1"
+    assert output == [
+        "- Monitoring evaluation 'e1'.",
+        "- Evaluation 'e1' completed successfully.",
+    ]
+    queries = [r[2] for r in nomad.requests]
+    assert queries == [
+        {},
+        {"index": "5", "wait": "300s"},
+        {"index": "10", "wait": "300s"},
+    ]
+
+
+def test_monitor_deployment_polling_fallback(nomad):
+    statuses = iter(["running", "successful"])
+
+    @nomad.route("GET", "/v1/deployment/d1")
+    def deployment(query, body):
+        return 200, {}, {"ID": "d1", "Status": next(statuses)}
+
+    config = make_config(nomad.address, wait_time=60, poll_interval=0.01)
+    watch = Watch(deployment_id="d1", echo=lambda message: None)
+    assert run(config, watch.poll(config))
+    assert [r[2] for r in nomad.requests] == [{}, {}]
+
+
+def test_event_monitor(nomad, root):
+    for id in ("e-api", "e-web"):
+        status = {"ID": id, "Status": "pending"}
+        nomad.route("GET", f"/v1/evaluation/{id}")(
+            lambda query, body, status=status: (200, {"X-Nomad-Index": "10"}, status)
+        )
+    for id in ("d-api", "d-web"):
+        status = {"ID": id, "Status": "running"}
+        nomad.route("GET", f"/v1/deployment/{id}")(
+            lambda query, body, status=status: (200, {"X-Nomad-Index": "12"}, status)
+        )
+
+    @nomad.route("GET", "/v1/event/stream")
+    def stream(query, body):
+        with open(root / "events/deploy.ndjson") as f:
+            return 200, {"Content-Type": "application/json"}, iter(f.readlines())
+
+    output = {"api": [], "web": []}
+    events = EventMonitor(make_config(nomad.address))
+    api = events.watch("api", "e-api", echo=output["api"].append)
+    web = events.watch("web", "e-web", echo=output["web"].append)
+    assert not run(events.config, events.run())
+
+    assert (api.success, web.success) == (True, False)
+    assert output["api"] == [
+        "- Monitoring evaluation 'e-api'.",
+        "- Evaluation 'e-api' completed successfully.",
+        "- Monitoring deployment 'd-api'.",
+        "- Deployment 'd-api' completed successfully.",
+    ]
+    assert output["web"][-1] == "\nDeployment failed: Failed due to progress deadline"
+    streams = [r for r in nomad.requests if r[1] == "/v1/event/stream"]
+    assert len(streams) == 1
+
+
+def test_event_monitor_fallback(nomad):
+    statuses = iter(["pending", "complete"])
+
+    @nomad.route("GET", "/v1/evaluation/e1")
+    def evaluation(query, body):
+        return 200, {"X-Nomad-Index": "10"}, {"ID": "e1", "Status": next(statuses)}
+
+    output = []
+    events = EventMonitor(make_config(nomad.address))
+    events.watch("api", "e1", follow_deployment=False, echo=output.append)
+    assert run(events.config, events.run())
+    assert output[-1] == "- Evaluation 'e1' completed successfully."
+    assert [r[1] for r in nomad.requests] == [
+        "/v1/evaluation/e1",
+        "/v1/event/stream",
+        "/v1/evaluation/e1",
+    ]
+
+
+def test_monitor_retries(nomad):
+    responses = iter([(500, {}, "No cluster leader"), (502, {}, "Bad Gateway")])
+
+    @nomad.route("GET", "/v1/deployment/d1")
+    def deployment(query, body):
+        return next(responses, (200, {}, {"ID": "d1", "Status": "successful"}))
+
+    config = make_config(nomad.address)
+    config.retry_policy.backoff = 0.01
+    watch = Watch(deployment_id="d1", echo=lambda message: None)
+    assert run(config, watch.poll(config))
+    assert len(nomad.requests) == 3
+
+    config = make_config(nomad.address, max_retries=1)
+    config.retry_policy.backoff = 0.01
+    nomad.route("GET", "/v1/deployment/d1")(lambda query, body: (503, {}, "down"))
+    watch = Watch(deployment_id="d1", echo=lambda message: None)
+    with pytest.raises(ApiError):
+        run(config, watch.poll(config))
+    assert len(nomad.requests) == 5
+
+
+@pytest.mark.parametrize(
+    "error, retries",
+    [(httpx.ConnectError, 1), (httpx.ReadTimeout, 1), (httpx.UnsupportedProtocol, 0)],
+)
+def test_retry_errors(error, retries):
+    budget = RetryPolicy(max_retries=1, backoff=0.01).budget()
+
+    async def send():
+        raise error("failed", request=None)
+
+    with pytest.raises(error):
+        runner.run(budget.call(send))
+    assert budget.retries == retries
@@ -1,15 +1,15 @@
-from pathlib import Path
+import os
 
 import pytest
+import yaml
+from click.testing import CliRunner
+from jinja2 import Environment, UndefinedError
 
+from dobby import cache, templates
+from dobby.cli import cli
 from dobby.templates import load_var_file, load_vars, os_env_to_dict, render
 
 
-@pytest.fixture
-def root():
-    return Path(__file__).parent
-
-
 def test_env_to_dict():
     source = {"JOB_NAME": "test", "SOME-other_var": "test", "SOMEOTHER_YETANOTHER": 42}
     result = os_env_to_dict(source)
@@ -68,3 +68,151 @@ def test_env_override(root):
     ).splitlines()
     assert data[0] == "job_name = testenv"
     assert data[1] == "database_url = testurl@env"
+
+
+def test_render_bytecode_cache(root, cache_dir, monkeypatch):
+    simple_template = root / "templates/simple.txt"
+    simple_vars = root / "vars/simple.yml"
+    expected = render(simple_template, [simple_vars])
+    assert templates.get_environment(
+        simple_template.parent
+    ) is templates.get_environment(simple_template.parent)
+    assert list((cache_dir / "templates").glob("*.cache"))
+
+    # A new environment loads the compiled template instead of compiling it
+    monkeypatch.setattr(templates, "_environments", {})
+
+    def compile(*args, **kwargs):
+        raise AssertionError("template compiled again")
+
+    monkeypatch.setattr(Environment, "compile", compile)
+    assert render(simple_template, [simple_vars]) == expected
+
+
+def test_vars_snapshot(root, tmp_path, monkeypatch):
+    var_file = tmp_path / "vars.yml"
+    var_file.write_text((root / "vars/vars.yml").read_text())
+    args = ["vars", "compile", "--timings-file", str(tmp_path / "t.json")]
+    result = CliRunner().invoke(cli, args + [str(var_file)])
+    assert result.exit_code == 0, result.output
+    assert '"name": "compile vars"' in (tmp_path / "t.json").read_text()
+
+    def load_var_file(f):
+        raise AssertionError("variable file loaded again")
+
+    with monkeypatch.context() as m:
+        m.setattr(templates, "load_var_file", load_var_file)
+        assert load_vars([var_file], {}) == {
+            "test": {"othervalue": 42},
+            "test1": 1,
+            "test2": 2,
+            "test3": 3,
+        }
+
+    var_file.write_text("test: 1\n")
+    assert load_vars([var_file], {"TEST1": "x"}) == {"test": 1, "test1": "x"}
+
+
+@pytest.mark.parametrize("name", ["vars.json", "vars.yml", "simple.yml"])
+def test_load_var_file_backends(root, monkeypatch, name):
+    fast = load_var_file(root / "vars" / name)
+    monkeypatch.setattr(templates, "SafeLoader", yaml.SafeLoader)
+    monkeypatch.setattr(templates, "orjson", None)
+    assert load_var_file(root / "vars" / name) == fast
+
+
+def test_load_json_fallback():
+    assert templates.load_json(b'{"a": NaN, "b": 1}')["b"] == 1
+
+
+def test_lazy_variables(root):
+    data = load_vars([root / "vars/vars.yml"], {"JOB_NAME": "x", "OTHER": "y"}, {"job"})
+    assert data == {"job": {"name": "x"}}
+
+    template = root / "templates/include.txt"
+    environ = {"JOB_NAME": "test", "ENV_STAGING_DATABASEURL": "staging"}
+    data = render(template, [root / "vars/simple.yml"], environ).splitlines()
+    assert data[0] == "job_name = test"
+    assert data[2:] == ["production: testurl@yaml", "staging: staging"]
+
+    with pytest.raises(UndefinedError) as e:
+        render(template, [], {"JOBNAME": "test", "ENV_PRODUCTION": "x"})
+    assert str(e.value) == "'str object' has no attribute 'database_url'"
+    with pytest.raises(UndefinedError) as e:
+        render(template, [], {"JOBNAME": "test", "ENV_PRODUCTION_X": "x"})
+    message = (
+        "'dobby.templates.NormalizedLookupDict object' has no attribute 'database_url'"
+    )
+    assert str(e.value) == message
+
+
+def test_normalized_lookups():
+    d = templates.NormalizedLookupDict({"foobar": {"items": 1}, "Raw": 2})
+    assert d["foobar"] == d["Foo_Bar"] == {"items": 1}
+    # Not normalized keys can never be looked up (thus no fast path either)
+    with pytest.raises(KeyError):
+        d["Raw"]
+
+    env = templates.NormalizedLookupEnvironment(**templates.DELIMITERS)
+    template = env.from_string("[[ v.Foo_Bar['items'] ]] [[ v.foobar.items()|list ]]")
+    assert template.render(v=d) == "1 [('items', 1)]"
+
+
+def test_render_profile(root, tmp_path):
+    stats = tmp_path / "render.pstats"
+    args = ["render", "--profile", "--profile-out", str(stats)]
+    args += [
+        "--var-file",
+        str(root / "vars/simple.yml"),
+        str(root / "templates/macros.txt"),
+    ]
+    result = CliRunner(mix_stderr=False).invoke(cli, args)
+    assert result.exit_code == 0
+    assert result.stdout.startswith('\nservice "a" { port = 4 }\n')
+
+    report = result.stderr.splitlines()
+    assert report[0] == "Template profile (1 render(s)):"
+    templates = {line.split()[-1] for line in report[3:5]}
+    assert templates == {"macros.txt", "simple.txt"}
+    assert report[7].split()[0] == "3"
+    assert report[7].endswith("macros.txt:service")
+    assert int(report[-1].split(": ")[1]) >= 5
+    assert stats.stat().st_size > 0
+
+
+def test_render_timings(root):
+    args = ["render", "--timings", "--var-file", str(root / "vars/simple.yml")]
+    result = CliRunner(mix_stderr=False).invoke(
+        cli, args + [str(root / "templates/simple.txt")]
+    )
+    assert result.exit_code == 0, result.output
+    assert result.output.startswith("job_name = test")
+    spans = [line.split()[0] for line in result.stderr.splitlines()[1:]]
+    assert spans == ["render"]
+
+
+def test_template_cache_eviction(root, cache_dir, monkeypatch):
+    monkeypatch.setattr(templates, "_environments", {})
+    monkeypatch.setattr(cache, "TEMPLATES_MAX_SIZE", 512 * 1024)
+    stale = cache_dir / "templates" / "stale.cache"
+    stale.parent.mkdir(parents=True)
+    stale.write_bytes(b"x" * 1024 * 1024)
+    os.utime(stale, (0, 0))
+
+    render(root / "templates/simple.txt", [root / "vars/simple.yml"])
+    assert not stale.exists()
+    assert list((cache_dir / "templates").glob("*.cache"))
+
+
+def test_template_analysis_eviction(root, cache_dir, monkeypatch):
+    monkeypatch.setattr(cache, "TEMPLATES_MAX_SIZE", 512 * 1024)
+    stale = cache_dir / "templates" / "stale.vars"
+    stale.parent.mkdir(parents=True)
+    stale.write_bytes(b"x" * 1024 * 1024)
+    os.utime(stale, (0, 0))
+
+    env = templates.get_environment(root / "templates")
+    info = templates.analyze_template(env, "[[ job_name ]]")
+    assert info["variables"] == ["job_name"]
+    assert not stale.exists()
+    assert len(list((cache_dir / "templates").glob("*.vars"))) == 1
@@ -0,0 +1,108 @@
+import gzip
+import json
+import ssl
+import subprocess
+import sys
+
+import pytest
+
+from dobby import runner
+from dobby.config import Config
+from dobby.utils import RawJob, job_body, scan_fields, send_job
+
+from .nomad import FakeNomad
+
+
+def test_raw_job():
+    raw = b' { "Stop" : false, "Meta": {"ID": "x"}, "ID": "a\\"b", "Type": "batch", "TaskGroups": [}'
+    job = RawJob(raw)
+    assert (job["ID"], job["Type"]) == ('a"b', "batch")
+    assert job_body(job, Diff=True).endswith(b'"Job":' + raw + b"}")
+
+    job = {"ID": "a", "Type": "service"}
+    assert json.loads(job_body(job)) == {"Job": job}
+    assert json.loads(job_body(job, Diff=True)) == {"Diff": True, "Job": job}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 32])
+def test_scan_fields_prefix(chunk_size):
+    # Values (and characters) crossing the end of the decoded prefix
+    raw = '{"Count": 12345, "ID": "été", "Type": "batch", "x": [}'.encode()
+    fields = scan_fields(raw, ("Count", "ID", "Type"), chunk_size)
+    assert fields == {"Count": 12345, "ID": "été", "Type": "batch"}
+
+    with pytest.raises(ValueError):
+        scan_fields(b'{"ID": "a", "Meta": {', ("ID", "Type"), chunk_size)
+
+
+def test_gzip_requests():
+    job = {"ID": "example", "Type": "service", "Meta": {"key": "value" * 1000}}
+    with FakeNomad() as nomad:
+        nomad.route("PUT", "/v1/jobs")(lambda query, body: (200, {}, {}))
+
+        config = Config(
+            nomad.address, *[None] * 7, gzip_requests=True, transfer_stats=True
+        )
+
+        async def submit():
+            async with config.client:
+                return await send_job(config, "PUT", "/v1/jobs", job, Diff=True)
+
+        assert runner.run(submit()).status_code == 200
+
+    body = nomad.requests[0][3]
+    assert json.loads(gzip.decompress(body)) == {"Diff": True, "Job": job}
+    report = config.transfer_stats.report()
+    assert report.startswith("HTTP traffic of 1 request(s): sent ")
+    assert "uncompressed" in report
+
+
+def test_lazy_imports():
+    # Modules only needed by some commands (and slow to import) are imported
+    # where needed, so that ie `dobby --help` starts quickly
+    code = (
+        "import sys, dobby.cli; "
+        "print(' '.join(m for m in sys.argv[1:] if m in sys.modules))"
+    )
+    deferred = ["httpx", "jinja2", "yaml", "dotenv", "ssl", "asyncio"]
+    process = subprocess.run(
+        [sys.executable, "-c", code, *deferred], stdout=subprocess.PIPE, check=True
+    )
+    assert process.stdout.decode().split() == []
+
+
+def test_ca_bundle_loaded_in_background(tmp_path):
+    ca_cert = tmp_path / "ca.pem"
+    ca_cert.write_text("not a certificate")
+    # Errors surface when the context is first used, not when it is created
+    config = Config("https://nomad.example:4646", None, None, str(ca_cert), *[None] * 4)
+    context = config.ssl_context(str(ca_cert))
+    with pytest.raises(ssl.SSLError):
+        context.wait_loaded()
+    runner.run(config.client.aclose())
+
+
+def test_tls_server_name():
+    config = Config("https://127.0.0.1:4646", *[None] * 6, "server.global.nomad")
+    context = config.client._transport._ssl_context
+    # asyncio passes the host connected to as `server_hostname`
+    tls = context.wrap_bio(
+        ssl.MemoryBIO(), ssl.MemoryBIO(), server_hostname="127.0.0.1"
+    )
+    assert tls.server_hostname == "server.global.nomad"
+    runner.run(config.client.aclose())
+
+
+def test_http_address_verifies_redirects(tmp_path):
+    ca_cert = tmp_path / "ca.pem"
+    ca_cert.write_text("not a certificate")
+    config = Config("http://nomad.example:4646", None, None, str(ca_cert), *[None] * 4)
+    context = config.client._transport._ssl_context
+    # A redirect to https:// is verified, the CA bundle is only loaded then
+    assert context.verify_mode == ssl.CERT_REQUIRED
+    assert context._loading is None
+    with pytest.raises(ssl.SSLError):
+        context.wrap_bio(
+            ssl.MemoryBIO(), ssl.MemoryBIO(), server_hostname="nomad.example"
+        )
+    runner.run(config.client.aclose())